@@ -0,0 +1,136 @@
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# Location of the activity database, overridable for deployments
+DEFAULT_PATH = os.environ.get("ACTIVITY_DB_PATH", "activity.db")
+
+# Largest number of entries written in one transaction
+BATCH_SIZE = 256
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS activity (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    entry_type TEXT NOT NULL,
+    message TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS activity_ts ON activity (ts);
+CREATE INDEX IF NOT EXISTS activity_type ON activity (entry_type, id);
+"""
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+# Convert a database row to the entry dict shown in the activity log
+def _entry(row):
+    entry_id, ts, entry_type, message = row
+    return {
+        "id": entry_id,
+        "timestamp": ts,
+        "time": datetime.fromtimestamp(ts).strftime("%H:%M:%S"),
+        "type": entry_type,
+        "message": message,
+    }
+
+
+# Append-only activity log backed by SQLite in WAL mode.
+# append() only enqueues the entry; a single writer thread drains the queue
+# and commits everything that accumulated in one transaction (group commit),
+# so callers never wait on disk. Readers use their own connections and run
+# concurrently with the writer.
+class ActivityStore:
+    def __init__(self, path=DEFAULT_PATH, batch_size=BATCH_SIZE):
+        self.path = path
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._local = threading.local()
+
+        conn = _connect(path)
+        conn.executescript(SCHEMA)
+        conn.close()
+
+        self._writer = threading.Thread(target=self._write_loop, name="activity-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    # Queue one entry for writing; O(1) for the caller
+    def append(self, message, entry_type="info", timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        self._queue.put((timestamp, entry_type, message))
+
+    # Block until every queued entry has been committed
+    def flush(self):
+        self._queue.join()
+
+    def _write_loop(self):
+        conn = _connect(self.path)
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with conn:
+                    conn.executemany("INSERT INTO activity (ts, entry_type, message) VALUES (?, ?, ?)", batch)
+            except sqlite3.Error:
+                logger.exception("Dropped %d activity entries", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _reader(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    # Newest-first page of entries, optionally filtered by type and time range.
+    # Pass the id of the last entry of a page as before_id to get the next
+    # page; keyset pagination keeps every page an index range scan. Reads
+    # never wait for the writer: entries still queued show up once their
+    # batch commits, a moment later.
+    def query(self, limit=10, entry_type=None, before_id=None, start=None, end=None):
+        clauses, params = [], []
+        if entry_type is not None:
+            clauses.append("entry_type = ?")
+            params.append(entry_type)
+        if before_id is not None:
+            clauses.append("id < ?")
+            params.append(before_id)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts <= ?")
+            params.append(end)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ""
+        rows = self._reader().execute(
+            f"SELECT id, ts, entry_type, message FROM activity {where} ORDER BY id DESC LIMIT ?",
+            params + [limit],
+        ).fetchall()
+        return [_entry(row) for row in rows]
+
+    # Number of entries written so far. Entries are never deleted, so this is
+    # the largest id: one primary key lookup instead of a full table scan.
+    def count(self):
+        return self._reader().execute("SELECT COALESCE(MAX(id), 0) FROM activity").fetchone()[0]
+
+    # Most recent entries, newest first
+    def recent(self, limit=10, entry_type=None):
+        return self.query(limit=limit, entry_type=entry_type)
@@ -0,0 +1,185 @@
+import threading
+import time
+
+from state_backend import update
+
+# Most alerts kept active at once; the oldest are dropped beyond this
+MAX_ALERTS = 50
+
+
+# A condition that raises an alert, declared once and evaluated on every
+# sensor tick or command. `trigger` decides when the alert fires and
+# `release` when the condition is over and it may fire again; keeping the two
+# apart gives hysteresis. `cooldown` is the minimum number of seconds between
+# two alerts for the same device.
+class AlertRule:
+    __slots__ = ('name', 'message', 'trigger', 'release', 'cooldown')
+
+    def __init__(self, name, message, trigger, release, cooldown=0):
+        self.name = name
+        self.message = message
+        self.trigger = trigger
+        self.release = release
+        self.cooldown = cooldown
+
+
+# Rule for a value rising above a threshold. The rule only re-arms once the
+# value has dropped back to release_at, so readings hovering around the
+# threshold do not flap.
+def threshold_rule(name, message, above, release_at=None, cooldown=0):
+    if release_at is None:
+        release_at = above
+    return AlertRule(
+        name,
+        message,
+        trigger=lambda value: value > above,
+        release=lambda value: value <= release_at,
+        cooldown=cooldown
+    )
+
+
+# Rule for a boolean condition such as "door opened while armed"
+def flag_rule(name, message, cooldown=0):
+    return AlertRule(
+        name,
+        message,
+        trigger=lambda value: bool(value),
+        release=lambda value: not value,
+        cooldown=cooldown
+    )
+
+
+# Rule for readings flagged by the anomaly detector: evaluate it with the
+# reading while it is flagged and None once the flag clears
+def anomaly_rule(name, message, cooldown=0):
+    return AlertRule(
+        name,
+        message,
+        trigger=lambda value: value is not None,
+        release=lambda value: value is None,
+        cooldown=cooldown
+    )
+
+
+class Alert:
+    __slots__ = ('rule', 'device', 'message', 'value', 'raised_at')
+
+    def __init__(self, rule, device, message, value, raised_at):
+        self.rule = rule
+        self.device = device
+        self.message = message
+        self.value = value
+        self.raised_at = raised_at
+
+
+# Evaluates rules and keeps the active alerts keyed by (rule, device), so
+# deduplication, lookup and clearing never scan the alert history. At most
+# `max_alerts` alerts and cooldown timestamps are kept, oldest dropped first.
+# Safe to share between sessions.
+class AlertEngine:
+    def __init__(self, rules, max_alerts=MAX_ALERTS):
+        self.rules = {rule.name: rule for rule in rules}
+        self.max_alerts = max_alerts
+        self._active = {}
+        self._tripped = set()
+        self._last_raised = {}
+        self._lock = threading.Lock()
+
+    # Feed the latest value of a device to a rule. Returns the new Alert when
+    # one is raised, otherwise None.
+    def evaluate(self, rule_name, device, value, now=None):
+        with self._lock:
+            return self._evaluate(self.rules[rule_name], device, value, now)
+
+    def _evaluate(self, rule, device, value, now):
+        rule_name = rule.name
+        key = (rule_name, device)
+
+        if key in self._tripped:
+            if rule.release(value):
+                self._tripped.discard(key)
+            return None
+        if not rule.trigger(value):
+            return None
+        self._tripped.add(key)
+
+        if now is None:
+            now = time.time()
+        if now - self._last_raised.get(key, float('-inf')) < rule.cooldown:
+            return None
+        self._last_raised.pop(key, None)
+        self._last_raised[key] = now
+
+        alert = Alert(rule_name, device, rule.message.format(device=device, value=value), value, now)
+        self._active.pop(key, None)
+        self._active[key] = alert
+        for recent in (self._active, self._last_raised):
+            while len(recent) > self.max_alerts:
+                del recent[next(iter(recent))]
+        return alert
+
+    def __len__(self):
+        return len(self._active)
+
+    def __contains__(self, key):
+        return key in self._active
+
+    # Active alerts, oldest first
+    def active_alerts(self):
+        with self._lock:
+            return list(self._active.values())
+
+    # Dismiss every active alert. Rules stay tripped until their release
+    # condition holds, so a condition that persists is not re-raised at once.
+    def clear(self):
+        with self._lock:
+            self._active = {}
+
+
+# Active alerts as seen by every replica, kept in a StateBackend under one
+# key. Alerts are stored by "rule:device", so raising the same alert again
+# replaces it, and only the newest `max_alerts` are kept. The local copy
+# follows the backend's change notification, so reading the board never
+# touches the backend.
+class AlertBoard:
+    KEY = 'alerts'
+
+    def __init__(self, backend, max_alerts=MAX_ALERTS):
+        self.backend = backend
+        self.max_alerts = max_alerts
+        self._alerts, self._version = backend.initialize({self.KEY: {}})[self.KEY]
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        backend.subscribe(self._on_change)
+
+    def _on_change(self, key, value, version):
+        if key == self.KEY:
+            with self._state_lock:
+                if version > self._version:
+                    self._alerts, self._version = value, version
+
+    def _write(self, change):
+        with self._lock:
+            value, version, _ = update(self.backend, self.KEY, change, self._alerts, self._version)
+            self._on_change(self.KEY, value, version)
+
+    def publish(self, alert):
+        entry = {'rule': alert.rule, 'device': alert.device, 'message': alert.message,
+                 'value': alert.value, 'raised_at': alert.raised_at}
+
+        def change(alerts):
+            key = f"{alert.rule}:{alert.device}"
+            kept = [(other, value) for other, value in alerts.items() if other != key]
+            kept = kept[max(len(kept) - self.max_alerts + 1, 0):]
+            return dict(kept + [(key, entry)]), None
+        self._write(change)
+
+    def __len__(self):
+        return len(self._alerts)
+
+    # Active alerts, oldest first
+    def active_alerts(self):
+        return [Alert(**entry) for entry in self._alerts.values()]
+
+    def clear(self):
+        self._write(lambda alerts: ({}, None))
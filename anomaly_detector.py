@@ -0,0 +1,121 @@
+import numpy as np
+
+# Samples a home needs before its readings are scored
+WARMUP = 30
+
+# Smoothing of the recent level and its variance
+EWMA_ALPHA = 0.1
+
+# Standard deviations from the recent level (EWMA) or from the long-run
+# baseline (Welford) that count as anomalous
+SUDDEN_Z = 4.0
+DRIFT_Z = 4.0
+
+# Quantiles tracked per home; readings must also fall outside this band
+QUANTILES = (0.01, 0.99)
+
+# Step of the quantile estimates, in recent standard deviations
+QUANTILE_STEP = 0.05
+
+# Motion is anomalous when a home's smoothed motion rate is below this
+MOTION_ALPHA = 0.01
+RARE_MOTION_RATE = 0.01
+
+# Floor for standard deviations, so perfectly flat sensors do not divide by zero
+MIN_STD = 1e-3
+
+
+# Streaming statistics of one sensor across every home, one array element per
+# home: Welford's running mean and variance (the long-run baseline), an
+# exponentially weighted mean and variance (the recent level) and a pair of
+# stochastic-approximation quantile estimates. Memory is a fixed handful of
+# floats per home however long the stream runs.
+class SensorStats:
+    def __init__(self, n_homes):
+        self.count = 0
+        self.mean = np.zeros(n_homes)
+        self.m2 = np.zeros(n_homes)
+        self.ewma = np.zeros(n_homes)
+        self.ewvar = np.zeros(n_homes)
+        self.low = np.zeros(n_homes)
+        self.high = np.zeros(n_homes)
+
+    def std(self):
+        return np.sqrt(self.m2 / max(self.count - 1, 1))
+
+    # Anomaly mask for new values, scored against the statistics before they
+    # are updated with them
+    def score(self, values):
+        if self.count < WARMUP:
+            return np.zeros(len(values), dtype=bool)
+        sudden = np.abs(values - self.ewma) > SUDDEN_Z * np.maximum(np.sqrt(self.ewvar), MIN_STD)
+        drift = np.abs(values - self.mean) > DRIFT_Z * np.maximum(self.std(), MIN_STD)
+        outside = (values < self.low) | (values > self.high)
+        return (sudden | drift) & outside
+
+    def update(self, values):
+        if self.count == 0:
+            self.ewma[:] = values
+            self.low[:] = values
+            self.high[:] = values
+        self.count += 1
+
+        # Welford
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (values - self.mean)
+
+        # EWMA of the level and of the squared deviation from it
+        deviation = values - self.ewma
+        self.ewma += EWMA_ALPHA * deviation
+        self.ewvar = (1 - EWMA_ALPHA) * (self.ewvar + EWMA_ALPHA * deviation * deviation)
+
+        # Move each quantile estimate up by step * q or down by step * (1 - q)
+        step = QUANTILE_STEP * np.maximum(np.sqrt(self.ewvar), MIN_STD)
+        low_q, high_q = QUANTILES
+        self.low += step * (low_q - (values < self.low))
+        self.high += step * (high_q - (values < self.high))
+
+
+# Scores every home's temperature and humidity against that home's own
+# baseline, and flags motion at homes where motion is rare, in one vectorised
+# pass per tick. Feed it the source's arrays after each tick.
+class AnomalyDetector:
+    SENSORS = ('temperature', 'humidity')
+
+    def __init__(self, n_homes):
+        self.n_homes = n_homes
+        self.stats = {sensor: SensorStats(n_homes) for sensor in self.SENSORS}
+        self.motion_rate = np.zeros(n_homes)
+        self.motion_count = 0
+        self.flags = {sensor: np.zeros(n_homes, dtype=bool) for sensor in self.SENSORS + ('motion',)}
+
+    # Score and learn one tick. `readings` maps each sensor to an array with
+    # one value per home and `new_motion` is the tick's rising-edge mask.
+    # Returns (sensor, home, value) for every home whose flag is set or was
+    # set on the previous tick, with value None once it has cleared, so the
+    # caller can raise and release alerts without looking at every home.
+    def update(self, readings, new_motion):
+        flags = {}
+        for sensor in self.SENSORS:
+            values = np.asarray(readings[sensor], dtype=np.float64)
+            flags[sensor] = self.stats[sensor].score(values)
+            self.stats[sensor].update(values)
+
+        rare = self.motion_rate < RARE_MOTION_RATE if self.motion_count >= WARMUP else np.zeros(self.n_homes, dtype=bool)
+        flags['motion'] = new_motion & rare
+        self.motion_rate += MOTION_ALPHA * (np.asarray(readings['motion'], dtype=np.float64) - self.motion_rate)
+        self.motion_count += 1
+
+        events = []
+        for sensor, mask in flags.items():
+            values = readings[sensor]
+            for home in np.flatnonzero(mask | self.flags[sensor]):
+                events.append((sensor, int(home), values[home].item() if mask[home] else None))
+        self.flags = flags
+        return events
+
+    # Long-run mean and standard deviation of a sensor at one home
+    def baseline(self, sensor, home=0):
+        stats = self.stats[sensor]
+        return float(stats.mean[home]), float(stats.std()[home])
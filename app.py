@@ -1,54 +1,188 @@
 import streamlit as st
-import pandas as pd
-import numpy as np
+import html
+import os
 import time
-import random
-from datetime import datetime
-import hashlib
-
-# Function to check login credentials
-def check_login(username, password):
-    # Simple authentication (in a real app, use secure password hashing)
-    # Example credentials
-    valid_users = {
-        "admin": hashlib.md5("password123".encode()).hexdigest()
-    }
-    
-    # Hash the input password
-    hashed_password = hashlib.md5(password.encode()).hexdigest()
-    
-    return username in valid_users and valid_users[username] == hashed_password
+from datetime import datetime, timedelta
+from functools import wraps
+from sensor_engine import SensorEngine, SharedSource
+from sensor_replay import ReplaySource, open_recording
+from sensor_history import SensorHistory, capacity_for
+from device_registry import DeviceRegistry
+from activity_store import ActivityStore
+from energy_pipeline import EnergyPipeline, SimulatedMeter, catch_up_periodically, HOURLY_PROFILE
+from load_optimizer import LoadOptimizer, HomeInputs, DEFAULT_TARIFF, irrigation_loads, appliance_loads, unscheduled_profile
+from device_commands import CommandBus, LoopbackTransport, PENDING, SENDING, ACKNOWLEDGED, SUPERSEDED
+from alert_rules import AlertEngine, AlertBoard, threshold_rule, flag_rule, anomaly_rule
+from anomaly_detector import AnomalyDetector
+from auth import Authenticator, RateLimited, SessionTokens, UserStore
+from metrics import Metrics, SamplingProfiler, serve, write_periodically
+from memory_usage import ResumeToken, session_state_bytes
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from state_backend import Lease, MemoryBackend, SqliteBackend
+from irrigation_scheduler import IrrigationScheduler, format_schedule, parse_schedule
+from command_journal import (
+    CommandJournal, SetLight, SetThermostat, SetFanSpeed, SetCamera, SetSecuritySystem, SetDoor,
+    SetIrrigationActive, ScheduleIrrigation
+)
+from camera_feed import CameraHub, open_source
+from device_inventory import DeviceInventory, DEFAULT_DEVICES, load_devices
+from styles import APP_CSS, LOGIN_CSS, style_tag
+from card_renderer import sensor_card, status_label, camera_card, forecast_card, alert_list
+
+# Maximum number of points sent to the browser per history chart
+CHART_POINTS = 600
+
+# Activity log entry types and page size
+ACTIVITY_TYPES = ["light", "thermostat", "fan", "security", "alert", "motion", "irrigation", "system"]
+ACTIVITY_PAGE_SIZE = 10
+
+# Seconds between automatic refreshes of the live sensor panel and alert banner (0 disables)
+SENSOR_REFRESH_SECONDS = float(os.environ.get("SENSOR_REFRESH_SECONDS", 5))
+
+# Recorded sensor data to replay instead of the simulator (a CSV file or a
+# columnar directory), and its playback speed ("max" plays one row per update)
+SENSOR_REPLAY_PATH = os.environ.get("SENSOR_REPLAY_PATH")
+SENSOR_REPLAY_SPEED = os.environ.get("SENSOR_REPLAY_SPEED", "1")
+
+# SQLite file holding device state and active alerts shared by every server
+# replica on this host; unset keeps them in this process only
+STATE_DB_PATH = os.environ.get("STATE_DB_PATH")
+
+# Metrics in Prometheus text format: served on 127.0.0.1:METRICS_PORT/metrics
+# and/or rewritten to METRICS_FILE every 15 seconds, when set
+METRICS_PORT = os.environ.get("METRICS_PORT")
+METRICS_FILE = os.environ.get("METRICS_FILE")
+
+# Seconds between samples of each session's session_state size
+SESSION_SAMPLE_SECONDS = 60
+
+# Per-session memory budget in bytes; three quarters of it sizes the sensor
+# history, and sampled sessions above it are counted in the metrics
+SESSION_MEMORY_BUDGET = int(os.environ.get("SESSION_MEMORY_BUDGET", 512 * 1024))
+
+# Sessions without a user interaction for this many seconds drop their live
+# state and keep only a small resume token (0 disables)
+SESSION_IDLE_SECONDS = float(os.environ.get("SESSION_IDLE_SECONDS", 1800))
+
+# With PROFILE_ENABLED=1, logged-in sessions opened with ?profile=1 write a
+# folded-stack profile here
+PROFILE_ENABLED = os.environ.get("PROFILE_ENABLED") == "1"
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "profiles")
+
+# Seconds between camera image refreshes on the Security tab, and a
+# directory of recorded `<camera>.npy` frame arrays to play instead of the
+# synthetic cameras
+CAMERA_REFRESH_SECONDS = float(os.environ.get("CAMERA_REFRESH_SECONDS", 1))
+CAMERA_SOURCE_DIR = os.environ.get("CAMERA_SOURCE_DIR")
+
+# Login accounts: a JSON object of username -> password hash from
+# auth.hash_password; the built-in admin account is used when unset
+AUTH_USERS_PATH = os.environ.get("AUTH_USERS_PATH")
+
+# Key signing session tokens, shared by replicas that should accept each
+# other's logins (a random key per process when unset), and token lifetime
+AUTH_SECRET = os.environ.get("AUTH_SECRET")
+AUTH_TOKEN_SECONDS = float(os.environ.get("AUTH_TOKEN_SECONDS", 12 * 3600))
+
+# IoT device inventory to load (a JSON list or JSON-lines file of devices);
+# the built-in appliances are used when unset
+IOT_INVENTORY_PATH = os.environ.get("IOT_INVENTORY_PATH")
+
+# Number of IoT devices per table page
+IOT_PAGE_SIZE = 25
+
+# Electricity price in $/kWh for each hour of the day (24 comma-separated
+# values), used to plan when shiftable loads run
+ENERGY_TARIFF = tuple(float(price) for price in os.environ["ENERGY_TARIFF"].split(",")) \
+    if os.environ.get("ENERGY_TARIFF") else tuple(DEFAULT_TARIFF.tolist())
+
+# Weather forecast for the next days; irrigation runs are skipped on rainy days
+WEATHER_FORECAST = [
+    {"day": "Today", "icon": "☀️", "temp": "24°C", "precip": 0},
+    {"day": "Tomorrow", "icon": "⛅", "temp": "22°C", "precip": 10},
+    {"day": "Day 3", "icon": "🌧️", "temp": "19°C", "precip": 60},
+]
+
+# Alert rules, evaluated on every sensor step or device command
+ALERT_RULES = [
+    threshold_rule("high_temperature", "Temperature above normal: {value}°C", above=26, release_at=25.5, cooldown=60),
+    threshold_rule("thermostat_high", "Thermostat set very high: {value}°C", above=28),
+    flag_rule("door_opened_armed", "Security alert: {device} door opened while system armed!"),
+    anomaly_rule("temperature_anomaly", "Unusual temperature for this {device}: {value}°C", cooldown=300),
+    anomaly_rule("humidity_anomaly", "Unusual humidity for this {device}: {value}%", cooldown=300),
+    anomaly_rule("motion_anomaly", "Motion where it is rarely seen: {device}", cooldown=300)
+]
+
+# Users, login throttling and session tokens are shared by every session.
+# Process-wide resources are cached without a spinner: it sends a
+# placeholder element on every call, even a cache hit, which made up most
+# of each live refresh's messages.
+@st.cache_resource(show_spinner=False)
+def get_authenticator():
+    secret = AUTH_SECRET.encode() if AUTH_SECRET else os.urandom(32)
+    return Authenticator(UserStore(AUTH_USERS_PATH), SessionTokens(secret, AUTH_TOKEN_SECONDS),
+                         backend=get_state_backend())
+
+# Address of this session's browser, for throttling logins
+def client_address():
+    ctx = get_script_run_ctx()
+    client = runtime.get_instance().get_client(ctx.session_id) if ctx and runtime.exists() else None
+    request = getattr(client, 'request', None)
+    return request.remote_ip if request is not None else "unknown"
+
+# Log in with the session token in the URL, so a reconnect or page reload
+# skips the password check
+def resume_login():
+    token = st.query_params.get("session")
+    if token is None:
+        return False
+    username = get_authenticator().resume(token)
+    if username is None:
+        del st.query_params["session"]
+        return False
+    st.session_state.logged_in = True
+    st.session_state.username = username
+    st.session_state.session_token = token
+    return True
+
+# Login callback: runs before the script, so no extra rerun is needed
+def attempt_login():
+    try:
+        with get_metrics().timer("login"):
+            token = get_authenticator().login(st.session_state.login_username, st.session_state.login_password,
+                                              client_address())
+    except RateLimited as error:
+        get_metrics().inc("throttled_logins")
+        st.session_state.login_error = str(error)
+        return
+    if token is None:
+        get_metrics().inc("failed_logins")
+        st.session_state.login_error = "Invalid username or password"
+        return
+    get_metrics().inc("logins")
+    st.query_params["session"] = token
+    st.session_state.logged_in = True
+    st.session_state.username = st.session_state.login_username
+    st.session_state.session_token = token
+    st.session_state.pop('login_error', None)
+    del st.session_state.login_password
 
 # Login Page
 def login_page():
     st.title("🏠 Smart Home Control Panel Login")
     
-    # Custom CSS for larger font and centered layout
-    st.markdown("""
-    <style>
-    .stApp {
-        font-size: 18px !important;
-    }
-    .stButton>button {
-        width: 100%;
-        font-size: 18px !important;
-    }
-    .stTextInput>div>div>input {
-        font-size: 18px !important;
-    }
-    </style>
-    """, unsafe_allow_html=True)
+    # Base and login CSS in one prebuilt style block
+    with get_metrics().timer("css"):
+        st.markdown(style_tag(APP_CSS, LOGIN_CSS), unsafe_allow_html=True)
     
     # Input fields directly without container
-    username = st.text_input("Username")
-    password = st.text_input("Password", type="password")
+    st.text_input("Username", key="login_username")
+    st.text_input("Password", type="password", key="login_password")
     
-    if st.button("Login"):
-        if check_login(username, password):
-            st.session_state.logged_in = True
-            st.experimental_rerun()
-        else:
-            st.error("Invalid username or password")
+    st.button("Login", on_click=attempt_login)
+    if 'login_error' in st.session_state:
+        st.error(st.session_state.login_error)
 
 # Set page config
 st.set_page_config(
@@ -57,23 +191,6 @@ st.set_page_config(
     layout="wide"
 )
 
-# Modify the existing CSS to increase font size
-st.markdown("""
-<style>
-.block-container {
-    padding-top: 1rem;
-    padding-bottom: 1rem;
-    font-size: 16px;
-}
-.card {
-    font-size: 16px;
-}
-.device-label {
-    font-size: 16px;
-}
-</style>
-""", unsafe_allow_html=True)
-
 # Initialize session state variables
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
@@ -87,220 +204,557 @@ if 'humidity' not in st.session_state:
 if 'motion' not in st.session_state:
     st.session_state.motion = False
 
-if 'lights' not in st.session_state:
-    st.session_state.lights = {'living': False, 'kitchen': True, 'bedroom': False}
+if 'activity_cursor' not in st.session_state:
+    st.session_state.activity_cursor = None
 
-if 'thermostat' not in st.session_state:
-    st.session_state.thermostat = 22
-
-if 'fan_speed' not in st.session_state:
-    st.session_state.fan_speed = 0
-
-if 'alerts' not in st.session_state:
-    st.session_state.alerts = []
-
-if 'activity_log' not in st.session_state:
-    st.session_state.activity_log = []
+if 'iot_page' not in st.session_state:
+    st.session_state.iot_page = 0
 
 if 'last_update' not in st.session_state:
     st.session_state.last_update = datetime.now().strftime("%H:%M:%S")
 
-if 'security_system' not in st.session_state:
-    st.session_state.security_system = 'disarmed'
-
-if 'cameras' not in st.session_state:
-    st.session_state.cameras = {'front_door': True, 'backyard': False, 'garage': False}
-
-if 'door_status' not in st.session_state:
-    st.session_state.door_status = {'main': 'closed', 'garage': 'closed', 'back': 'closed'}
-
-if 'energy_data' not in st.session_state:
-    st.session_state.energy_data = {
-        'daily_usage': random.uniform(8, 15),
-        'weekly_total': random.uniform(50, 90),
-        'monthly_total': random.uniform(180, 250)
-    }
-
-if 'irrigation_zones' not in st.session_state:
-    st.session_state.irrigation_zones = {
-        'front_lawn': {'active': False, 'schedule': '06:00 AM', 'duration': 15},
-        'backyard': {'active': False, 'schedule': '07:00 AM', 'duration': 20},
-        'garden': {'active': False, 'schedule': '05:30 AM', 'duration': 10}
-    }
-
 if 'current_tab' not in st.session_state:
     st.session_state.current_tab = "Dashboard"
 
+if 'last_interaction' not in st.session_state:
+    st.session_state.last_interaction = time.time()
+
+# Live per-session state, only built for the dashboard and dropped again when
+# an idle session is evicted
+def init_live_state():
+    if 'sensor_history' not in st.session_state:
+        st.session_state.sensor_history = SensorHistory(capacity=capacity_for(SESSION_MEMORY_BUDGET * 3 // 4))
+
+# Drop everything but the login and a resume token from an idle session
+def evict_session():
+    token = ResumeToken(st.session_state)
+    for key in list(st.session_state.keys()):
+        if key not in ('logged_in', 'username', 'session_token'):
+            del st.session_state[key]
+    st.session_state.resume_token = token
+    get_metrics().inc("sessions_evicted")
+
+# Resume callback: restore the token; live state is rebuilt on the rerun
+def resume_session():
+    st.session_state.resume_token.restore(st.session_state)
+    del st.session_state.resume_token
+    st.session_state.last_interaction = time.time()
+
+# The home's sensors (simulated, or a replayed recording) are shared by
+# every session of the process and advanced once per SENSOR_REFRESH_SECONDS,
+# so each motion, door event and sensor alert reaches the shared registry,
+# journal, activity log and alert board once however many sessions are open
+@st.cache_resource(show_spinner=False)
+def get_sensor_source():
+    if SENSOR_REPLAY_PATH:
+        speed = None if SENSOR_REPLAY_SPEED == "max" else float(SENSOR_REPLAY_SPEED)
+        source = ReplaySource(open_recording(SENSOR_REPLAY_PATH), speed=speed)
+    else:
+        source = SensorEngine(n_homes=1)
+    return SharedSource(source, SENSOR_REFRESH_SECONDS)
+
+@st.cache_resource(show_spinner=False)
+def get_anomaly_detector():
+    return AnomalyDetector(get_sensor_source().n_homes)
+
+# Device state and alerts live in one state backend per process, shared with
+# other replicas through STATE_DB_PATH when it is set
+@st.cache_resource(show_spinner=False)
+def get_state_backend():
+    return SqliteBackend(STATE_DB_PATH) if STATE_DB_PATH else MemoryBackend()
+
+# Every device change is journaled (JOURNAL_DIR, default "journal/"), so the
+# house comes back as it was after a restart
+@st.cache_resource(show_spinner=False)
+def get_command_journal():
+    return CommandJournal()
+
+# Device state is shared by every session and replica, starting from the
+# state recovered from the journal
+@st.cache_resource(show_spinner=False)
+def get_device_registry():
+    journal = get_command_journal()
+    return DeviceRegistry(initial_state=journal.state(), backend=get_state_backend(), journal=journal)
+
+# Active alerts are shared the same way
+@st.cache_resource(show_spinner=False)
+def get_alert_board():
+    return AlertBoard(get_state_backend())
+
+# Rules are evaluated by one engine per process, since the sensors and
+# devices are shared: a door opened in one session and closed in another
+# releases the same rule
+@st.cache_resource(show_spinner=False)
+def get_alert_engine():
+    return AlertEngine(ALERT_RULES)
+
+# Device commands go out through one background command bus per process.
+# The loopback transport stands in for the real device hub.
+@st.cache_resource(show_spinner=False)
+def get_command_bus():
+    return CommandBus(LoopbackTransport())
+
+# Function to send a command to a device without waiting for it
+def send_command(device, action, value=None):
+    get_metrics().inc("commands", device_type=device.split(":")[0])
+    get_command_bus().submit(device, action, value)
+
+# Small indicator of the last command sent to a device
+def command_badge(device):
+    command = get_command_bus().status(device)
+    if command is None or command.status in (ACKNOWLEDGED, SUPERSEDED):
+        return ""
+    if command.status in (PENDING, SENDING):
+        return " <span title='Waiting for device'>⏳</span>"
+    return f" <span title='{html.escape(command.error, quote=True)}'>⚠️</span>"
+
+# Camera frames are captured once per process for cameras that are on, and
+# encoded only while a session is watching them
+@st.cache_resource(show_spinner=False)
+def get_camera_hub():
+    registry = get_device_registry()
+    return CameraHub({camera: open_source(camera, CAMERA_SOURCE_DIR) for camera in registry.get('cameras')},
+                     enabled=lambda camera: registry.get('cameras')[camera],
+                     max_fps=1 / CAMERA_REFRESH_SECONDS)
+
+# Energy rollups are shared by every session; the simulated meter starts at
+# the beginning of last month so month-over-month deltas have data
+@st.cache_resource(show_spinner=False)
+def get_energy_pipeline():
+    return EnergyPipeline()
+
+@st.cache_resource(show_spinner=False)
+def get_energy_meter():
+    last_month = (datetime.now().replace(day=1) - timedelta(days=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    return SimulatedMeter(start=last_month.timestamp())
+
+# Load-shifting plans are memoised per process by their inputs
+@st.cache_resource(show_spinner=False)
+def get_load_optimizer():
+    return LoadOptimizer()
+
+# Today's load-shifting plan for this home: the metered profile of the last
+# day (the typical profile until a day has been metered) less the loads
+# being planned, which it already includes at their current starts, the
+# tariff, the irrigation zones and shiftable appliances, and the climate
+# settings
+def energy_plan(devices):
+    profile = get_energy_pipeline().hourly_profile()
+    loads = irrigation_loads(devices['irrigation_zones']) + appliance_loads(get_device_inventory().values('type'))
+    home = HomeInputs(
+        profile=tuple(unscheduled_profile(HOURLY_PROFILE if profile is None else profile, loads).tolist()),
+        tariff=ENERGY_TARIFF,
+        loads=loads,
+        thermostat=devices['thermostat'],
+        fan_speed=devices['fan_speed']
+    )
+    return get_load_optimizer().plan(home)
+
+# Move every irrigation zone whose planned start hour differs to that hour,
+# keeping the minute it was scheduled at (plans work in whole hours)
+def apply_irrigation_plan(plan):
+    zones = get_device_registry().get('irrigation_zones')
+    for load in plan.loads:
+        if load.name in zones and load.start != load.current_start:
+            minute = parse_schedule(zones[load.name]['schedule']) % 60
+            update_irrigation_schedule(load.name, format_schedule(load.start * 60 + minute), zones[load.name]['duration'])
+
+# Irrigation schedules are kept by one scheduler per process, seeded from
+# the registry's zones and the weather forecast and following schedule
+# changes made in any session or replica
+@st.cache_resource(show_spinner=False)
+def get_irrigation_scheduler():
+    scheduler = IrrigationScheduler()
+    scheduler.sync_zones(get_device_registry().get('irrigation_zones'))
+
+    def follow(group, value, version):
+        if group == 'irrigation_zones':
+            scheduler.sync_zones(value)
+    get_state_backend().subscribe(follow)
+
+    today = datetime.now().date()
+    for i, day in enumerate(WEATHER_FORECAST):
+        scheduler.set_forecast(today + timedelta(days=i), day['precip'])
+    return scheduler
+
+# The activity log is durable and shared by every session on this server process
+@st.cache_resource(show_spinner=False)
+def get_activity_store():
+    return ActivityStore()
+
+# The IoT device inventory is loaded once per process; devices are then
+# added, updated and removed through it individually
+@st.cache_resource(show_spinner=False)
+def get_device_inventory():
+    return DeviceInventory(load_devices(IOT_INVENTORY_PATH) if IOT_INVENTORY_PATH else DEFAULT_DEVICES)
+
+# IoT device table pagination callbacks
+def first_iot_page():
+    st.session_state.iot_page = 0
+
+def change_iot_page(step):
+    st.session_state.iot_page = max(0, st.session_state.iot_page + step)
+
+# Process-wide metrics, with gauges read when the metrics are scraped
+@st.cache_resource(show_spinner=False)
+def get_metrics():
+    metrics = Metrics()
+    metrics.describe("reruns", "counter", "Full script reruns")
+    metrics.describe("logins", "counter", "Successful logins")
+    metrics.describe("failed_logins", "counter", "Rejected logins")
+    metrics.describe("throttled_logins", "counter", "Login attempts refused by the rate limiter")
+    metrics.describe("commands", "counter", "Device commands sent, by device type")
+    metrics.describe("alerts_raised", "counter", "Alerts raised, by rule")
+    metrics.describe("sessions_evicted", "counter", "Idle sessions whose live state was dropped")
+    metrics.describe("session_budget_exceeded", "counter", "Session samples above SESSION_MEMORY_BUDGET")
+    metrics.describe("phase_seconds", "histogram", "Time spent in each phase of a rerun")
+    metrics.describe("camera_viewers", "gauge", "Sessions watching each camera")
+    metrics.describe("camera_fps", "gauge", "Frames encoded per second for each camera")
+    metrics.describe("active_sessions", "gauge", "Connected browser sessions")
+    metrics.describe("activity_log_entries", "gauge", "Entries in the activity log")
+    metrics.describe("active_alerts", "gauge", "Alerts shown on the alert board")
+    metrics.describe("session_state_bytes", "gauge", "Approximate session_state size, summed or maxed over sampled sessions")
+    metrics.gauge_function("active_sessions", count_active_sessions)
+    # Gauges run on the scraping thread, where st.cache_resource functions
+    # cannot be called, so they hold the objects themselves
+    activity_store, alert_board, camera_hub = get_activity_store(), get_alert_board(), get_camera_hub()
+    metrics.gauge_function("activity_log_entries", activity_store.count)
+    metrics.gauge_function("active_alerts", lambda: len(alert_board))
+    for camera in camera_hub.sources:
+        metrics.gauge_function("camera_viewers", lambda camera=camera: camera_hub.viewers(camera), camera=camera)
+        metrics.gauge_function("camera_fps", lambda camera=camera: camera_hub.fps(camera), camera=camera)
+    samples = get_session_samples()
+    metrics.gauge_function("session_state_bytes", lambda: sum(size for _, size in list(samples.values())), stat="sum")
+    metrics.gauge_function("session_state_bytes", lambda: max((size for _, size in list(samples.values())), default=0), stat="max")
+    if METRICS_PORT:
+        serve(metrics, int(METRICS_PORT))
+    if METRICS_FILE:
+        write_periodically(metrics, METRICS_FILE)
+    return metrics
+
+# Connected browser sessions. Streamlit has no public API for this, so the
+# gauge reads NaN rather than failing if its session manager changes.
+def count_active_sessions():
+    if not runtime.exists():
+        return 0
+    session_mgr = getattr(runtime.get_instance(), '_session_mgr', None)
+    if not hasattr(session_mgr, 'num_active_sessions'):
+        return float("nan")
+    return session_mgr.num_active_sessions()
+
+# Latest (time, bytes) session_state sample of each session
+@st.cache_resource(show_spinner=False)
+def get_session_samples():
+    return {}
+
+# Record this session's session_state size at most every SESSION_SAMPLE_SECONDS
+def sample_session_bytes():
+    samples = get_session_samples()
+    now = time.time()
+    ctx = get_script_run_ctx()
+    session_id = ctx.session_id if ctx else "local"
+    if now - samples.get(session_id, (0, 0))[0] >= SESSION_SAMPLE_SECONDS:
+        samples[session_id] = (now, sum(session_state_bytes(st.session_state).values()))
+        if samples[session_id][1] > SESSION_MEMORY_BUDGET:
+            get_metrics().inc("session_budget_exceeded")
+        # Forget sessions that have not rerun for a while
+        for stale in [key for key, (sampled_at, _) in samples.items() if now - sampled_at > 10 * SESSION_SAMPLE_SECONDS]:
+            samples.pop(stale, None)
+
+# Decorator timing a device mutator into the phase_seconds histogram
+def timed(function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with get_metrics().timer(function.__name__):
+            return function(*args, **kwargs)
+    return wrapper
+
 # Function to add to activity log
 def add_activity(message, entry_type="info"):
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    st.session_state.activity_log.insert(0, {"message": message, "time": timestamp, "type": entry_type})
-    if len(st.session_state.activity_log) > 10:
-        st.session_state.activity_log.pop()
+    get_activity_store().append(message, entry_type)
+
+# Activity log pagination callbacks
+def older_activity(before_id):
+    st.session_state.activity_cursor = before_id
+
+def newest_activity():
+    st.session_state.activity_cursor = None
+
+# Function to evaluate an alert rule and log the alert if one is raised
+def check_alert(rule, device, value):
+    alert = get_alert_engine().evaluate(rule, device, value)
+    if alert:
+        get_metrics().inc("alerts_raised", rule=rule)
+        get_alert_board().publish(alert)
+        add_activity(alert.message, "alert")
 
 # Function to toggle lights
+@timed
 def toggle_light(room):
-    st.session_state.lights[room] = not st.session_state.lights[room]
-    status = "on" if st.session_state.lights[room] else "off"
+    is_on = get_device_registry().toggle('lights', room, command=lambda is_on: SetLight(room, is_on))
+    send_command(f"light:{room}", "set", is_on)
+    status = "on" if is_on else "off"
     add_activity(f"{room.capitalize()} light turned {status}", "light")
 
 # Function to change thermostat
+@timed
 def update_thermostat(new_value):
-    old_value = st.session_state.thermostat
-    st.session_state.thermostat = new_value
+    old_value = get_device_registry().set('thermostat', new_value, command=SetThermostat(new_value))
+    send_command("thermostat", "set", new_value)
     add_activity(f"Thermostat changed from {old_value}°C to {new_value}°C", "thermostat")
     
     # Check if thermostat is set too high
-    if new_value > 28 and not any("Thermostat set very high" in alert for alert in st.session_state.alerts):
-        st.session_state.alerts.append(f"Thermostat set very high: {new_value}°C")
+    check_alert("thermostat_high", "thermostat", new_value)
 
 # Function to change fan speed
+@timed
 def update_fan_speed(new_speed):
-    old_speed = st.session_state.fan_speed
-    st.session_state.fan_speed = new_speed
+    old_speed = get_device_registry().set('fan_speed', new_speed, command=SetFanSpeed(new_speed))
+    send_command("fan", "set", new_speed)
     speed_name = "Off" if new_speed == 0 else f"Level {new_speed}"
     old_speed_name = "Off" if old_speed == 0 else f"Level {old_speed}"
     add_activity(f"Fan speed changed from {old_speed_name} to {speed_name}", "fan")
 
 # Function to toggle camera
+@timed
 def toggle_camera(camera):
-    st.session_state.cameras[camera] = not st.session_state.cameras[camera]
-    status = "on" if st.session_state.cameras[camera] else "off"
+    is_on = get_device_registry().toggle('cameras', camera, command=lambda is_on: SetCamera(camera, is_on))
+    send_command(f"camera:{camera}", "set", is_on)
+    status = "on" if is_on else "off"
     add_activity(f"{camera.replace('_', ' ').capitalize()} camera turned {status}", "security")
 
 # Function to change security system status
+@timed
 def update_security_system(new_status):
-    old_status = st.session_state.security_system
-    st.session_state.security_system = new_status
+    old_status = get_device_registry().set('security_system', new_status, command=SetSecuritySystem(new_status))
+    send_command("security_system", "set", new_status)
     add_activity(f"Security system changed from {old_status} to {new_status}", "security")
 
 # Function to update door status
+@timed
 def update_door(door, status):
-    old_status = st.session_state.door_status[door]
-    st.session_state.door_status[door] = status
+    registry = get_device_registry()
+    old_status = registry.set_item('door_status', door, status, command=SetDoor(door, status))
+    send_command(f"door:{door}", "set", status)
     add_activity(f"{door.capitalize()} door {status}", "security")
     
     # Add alert if door is opened while security system is armed
-    if status == "open" and st.session_state.security_system != "disarmed":
-        alert_message = f"Security alert: {door} door opened while system armed!"
-        st.session_state.alerts.append(alert_message)
-        add_activity(alert_message, "alert")
+    check_alert("door_opened_armed", door, status == "open" and registry.get('security_system') != "disarmed")
 
 # Function to toggle irrigation zone
+@timed
 def toggle_irrigation(zone):
-    st.session_state.irrigation_zones[zone]['active'] = not st.session_state.irrigation_zones[zone]['active']
-    status = "activated" if st.session_state.irrigation_zones[zone]['active'] else "deactivated"
+    active = get_device_registry().toggle('irrigation_zones', zone, 'active',
+                                          command=lambda active: SetIrrigationActive(zone, active))
+    send_command(f"irrigation:{zone}", "set", active)
+    status = "activated" if active else "deactivated"
     add_activity(f"{zone.replace('_', ' ').capitalize()} irrigation zone {status}", "irrigation")
 
 # Function to update irrigation schedule
+@timed
 def update_irrigation_schedule(zone, schedule, duration):
-    st.session_state.irrigation_zones[zone]['schedule'] = schedule
-    st.session_state.irrigation_zones[zone]['duration'] = duration
+    get_device_registry().update_item('irrigation_zones', zone, command=ScheduleIrrigation(zone, schedule, duration),
+                                      schedule=schedule, duration=duration)
+    get_irrigation_scheduler().sync_zones(get_device_registry().get('irrigation_zones'))
+    send_command(f"irrigation:{zone}", "schedule", (schedule, duration))
     add_activity(f"{zone.replace('_', ' ').capitalize()} irrigation schedule updated", "irrigation")
 
-# Simulate sensor updates
+# Advance the shared sensors if a step is due and bring this session up to
+# their latest step. Both live fragments call this before rendering, so
+# whichever runs first in an interval advances the sensors and both show
+# the same step; the history records each step once.
 def update_sensors():
-    # Update temperature with small random changes
-    temp_change = (random.random() - 0.5) * 0.8
-    st.session_state.temperature = round(st.session_state.temperature + temp_change, 1)
-
-    # Update humidity with small random changes
-    humidity_change = (random.random() - 0.5) * 2
-    st.session_state.humidity = min(max(round(st.session_state.humidity + humidity_change), 30), 70)
-
-    # Random motion detection (10% chance)
-    if random.random() < 0.1:
-        if not st.session_state.motion:
-            st.session_state.motion = True
-            add_activity("Motion detected", "motion")
-    else:
-        if st.session_state.motion:
-            st.session_state.motion = False
+    source = get_sensor_source()
+    step = source.step()
+    tick, reading, stepped_at = source.latest(0)
+    if st.session_state.get('sensor_tick') != tick:
+        st.session_state.sensor_tick = tick
+        st.session_state.temperature = reading['temperature']
+        st.session_state.humidity = reading['humidity']
+        st.session_state.motion = reading['motion']
+        st.session_state.sensor_history.record(reading)
+        st.session_state.last_update = datetime.fromtimestamp(stepped_at).strftime("%H:%M:%S")
+
+    # Another session already advanced the sensors this interval and
+    # handled what happened
+    if step is None:
+        return
+    new_motion, door_events = step
+
+    if new_motion[0]:
+        add_activity("Motion detected", "motion")
+
+    # Recorded door events for known doors go through the normal door path
+    doors = get_device_registry().get('door_status')
+    for door, status in door_events:
+        if door in doors:
+            update_door(door, status)
 
     # Check for temperature alerts
-    if st.session_state.temperature > 26 and not any("Temperature above normal" in alert for alert in st.session_state.alerts):
-        alert_message = f"Temperature above normal: {st.session_state.temperature}°C"
-        st.session_state.alerts.append(alert_message)
-        add_activity(alert_message, "alert")
+    check_alert("high_temperature", "home", reading['temperature'])
+
+    # Readings that are unusual for this home raise or release anomaly alerts
+    for sensor, home, value in get_anomaly_detector().update(source.arrays(), new_motion):
+        check_alert(f"{sensor}_anomaly", "home" if source.n_homes == 1 else f"home {home}", value)
+
+# Only the replica holding this lease runs the irrigation schedule and
+# publishes energy totals, so replicas sharing STATE_DB_PATH neither repeat
+# each other's runs nor overwrite each other's totals
+@st.cache_resource(show_spinner=False)
+def get_duty_lease():
+    return Lease(get_state_backend(), "duties")
+
+# Irrigation runs and energy totals are house duties rather than page work:
+# background threads advance the schedule and catch up with the meter
+# whether or not anyone has the dashboard open. Every replica keeps its own
+# scheduler and rollups; only the lease holder acts on the schedule and
+# publishes the shared totals, and one that takes over the lease carries on
+# from the same point. The threads hold their objects, since
+# st.cache_resource functions cannot be called from them.
+@st.cache_resource(show_spinner=False)
+def start_house_duties():
+    registry, bus, metrics, activity = get_device_registry(), get_command_bus(), get_metrics(), get_activity_store()
+    lease, pipeline = get_duty_lease(), get_energy_pipeline()
+
+    def run_irrigation_schedule(actions):
+        if not lease.held():
+            return
+        for zone, action, reason in actions:
+            zone_name = zone.replace('_', ' ').capitalize()
+            if action in ("start", "stop"):
+                active = action == "start"
+                registry.update_item('irrigation_zones', zone, command=SetIrrigationActive(zone, active), active=active)
+                metrics.inc("commands", device_type="irrigation")
+                bus.submit(f"irrigation:{zone}", "set", active)
+                activity.append(f"{zone_name} irrigation zone {'started' if active else 'finished'} on schedule",
+                                "irrigation")
+            elif action == "wait":
+                activity.append(f"{zone_name} irrigation zone waiting: {reason}", "irrigation")
+            else:
+                activity.append(f"{zone_name} irrigation run skipped: {reason}", "irrigation")
+
+    def publish_energy():
+        if lease.held():
+            registry.set('energy_data', pipeline.summary())
+
+    get_irrigation_scheduler().run_in_background(run_irrigation_schedule)
+    catch_up_periodically(pipeline, get_energy_meter(), publish_energy)
+
+# Navigation callbacks run before the script, so no extra rerun is needed
+def select_tab(tab):
+    st.session_state.current_tab = tab
+
+# Logging out revokes this session's token, so a copied link or a history
+# entry no longer logs back in; other operators' logins stay valid
+def logout():
+    st.session_state.logged_in = False
+    st.session_state.pop('username', None)
+    if 'session_token' in st.session_state:
+        get_authenticator().revoke(st.session_state.session_token)
+        del st.session_state.session_token
+    if "session" in st.query_params:
+        del st.query_params["session"]
+
+def clear_alerts():
+    get_alert_engine().clear()
+    get_alert_board().clear()
+    add_activity("All alerts cleared", "system")
+
+# Alert banner: advances the sensors and re-renders on its own timer,
+# without re-running the rest of the page
+@st.experimental_fragment(run_every=SENSOR_REFRESH_SECONDS or None)
+def live_alert_banner():
+    # Idle sessions free their live state and show the resume page instead
+    if SESSION_IDLE_SECONDS and time.time() - st.session_state.last_interaction > SESSION_IDLE_SECONDS:
+        evict_session()
+        st.rerun()
+
+    metrics = get_metrics()
+    with metrics.timer("update_sensors"):
+        update_sensors()
+    st.markdown(f"<p style='text-align: right; color: gray; font-size: 0.8rem;'>Last updated: {st.session_state.last_update}</p>", unsafe_allow_html=True)
 
-    # Update timestamp
-    st.session_state.last_update = datetime.now().strftime("%H:%M:%S")
+    # Display alerts if any
+    alert_board = get_alert_board()
+    if alert_board:
+        with metrics.timer("alerts"):
+            messages = tuple(alert.message for alert in alert_board.active_alerts())
+            st.markdown(alert_list(messages), unsafe_allow_html=True)
+
+        # Add clear alerts button
+        st.button("Clear Alerts", on_click=clear_alerts)
+
+# Sensor Data card, refreshed on the same interval as the alert banner.
+# The two fragments run on separate timers, so each syncs to the shared
+# sensors' latest step rather than showing what the other saw last.
+@st.experimental_fragment(run_every=SENSOR_REFRESH_SECONDS or None)
+def live_sensor_panel():
+    with get_metrics().timer("update_sensors"):
+        update_sensors()
+    doors = tuple(get_device_registry().get('door_status').items())
+    st.markdown(sensor_card(st.session_state.temperature, st.session_state.humidity, st.session_state.motion, doors),
+                unsafe_allow_html=True)
+
+# Latest frame of one camera, refreshed on its own timer while the Security
+# tab is open and the camera is on
+@st.experimental_fragment(run_every=CAMERA_REFRESH_SECONDS)
+def live_camera_feed(camera):
+    if not get_device_registry().get('cameras')[camera]:
+        return
+    ctx = get_script_run_ctx()
+    frame = get_camera_hub().frame(camera, ctx.session_id if ctx else "local")
+    if frame is None:
+        st.caption("Waiting for the camera…")
+    else:
+        st.image(frame, use_column_width=True)
 
 # Main dashboard content
 def main_dashboard():
+    # Base CSS, prebuilt once per process
+    with get_metrics().timer("css"):
+        st.markdown(style_tag(APP_CSS), unsafe_allow_html=True)
+
     # Logout button and title row
     col1, col2, col3 = st.columns([3, 2, 1])
     with col3:
-        if st.button("Logout", key="main_logout", use_container_width=True):
-            st.session_state.logged_in = False
-            st.experimental_rerun()
+        st.button("Logout", key="main_logout", on_click=logout, use_container_width=True)
 
     # Main title bar
     st.title("🏠 Smart Home Control Panel")
-    st.markdown(f"<p style='text-align: right; color: gray; font-size: 0.8rem;'>Last updated: {st.session_state.last_update}</p>", unsafe_allow_html=True)
 
-    # Update data every time the page is loaded
-    update_sensors()
+    # Sensors and alerts refresh on their own; see live_alert_banner()
+    live_alert_banner()
 
-    # Display alerts if any
-    if st.session_state.alerts:
-        for alert in st.session_state.alerts:
-            st.markdown(f"<div class='alert'><strong>⚠️ Alert:</strong> {alert}</div>", unsafe_allow_html=True)
-
-        # Add clear alerts button
-        if st.button("Clear Alerts"):
-            st.session_state.alerts = []
-            add_activity("All alerts cleared", "system")
-            st.experimental_rerun()
+    # Read the shared device state once per rerun
+    devices = get_device_registry().snapshot()
 
     # Create tabs using buttons
     tabs = ["Dashboard", "Security", "Energy", "Irrigation", "IoT Devices"]
     cols = st.columns(len(tabs))
 
     for i, tab in enumerate(tabs):
-        active_class = "tab-button-active" if st.session_state.current_tab == tab else ""
-        if cols[i].button(tab, key=f"tab_{tab}", use_container_width=True):
-            st.session_state.current_tab = tab
-            st.experimental_rerun()
+        cols[i].button(tab, key=f"tab_{tab}", on_click=select_tab, args=(tab,), use_container_width=True)
+
+    # Time the selected tab's content
+    tab_timer = get_metrics().timer(f"tab:{st.session_state.current_tab}")
 
     # Dashboard tab content
     if st.session_state.current_tab == "Dashboard":
         col1, col2 = st.columns(2)
 
         with col1:
-            st.markdown("<div class='card'>", unsafe_allow_html=True)
-            st.subheader("📊 Sensor Data")
-            # Temperature
-            temp_color = "red" if st.session_state.temperature > 25 else "black"
-            st.markdown(f"<div class='device-label'>🌡️ Temperature <span class='sensor-value' style='color: {temp_color};'>{st.session_state.temperature}°C</span></div>", unsafe_allow_html=True)
-            st.progress((st.session_state.temperature - 15) / 20)
-
-            # Humidity
-            st.markdown(f"<div class='device-label'>💧 Humidity <span class='sensor-value'>{st.session_state.humidity}%</span></div>", unsafe_allow_html=True)
-            st.progress(st.session_state.humidity / 100)
-
-            # Motion
-            motion_status = "Detected" if st.session_state.motion else "None"
-            motion_color = "green" if st.session_state.motion else "gray"
-            st.markdown(f"<div class='device-label'>📡 Motion <span class='sensor-value' style='color: {motion_color};'>{motion_status}</span></div>", unsafe_allow_html=True)
-
-            # Door statuses
-            for door, status in st.session_state.door_status.items():
-                door_color = "red" if status == "open" else "green"
-                st.markdown(f"<div class='device-label'>🚪 {door.capitalize()} Door <span class='sensor-value' style='color: {door_color};'>{status.capitalize()}</span></div>", unsafe_allow_html=True)
-            st.markdown("</div>", unsafe_allow_html=True)
+            live_sensor_panel()
 
         with col2:
-            st.markdown("<div class='card'>", unsafe_allow_html=True)
             st.subheader("🎮 Device Control")
             # Thermostat Control
-            st.markdown(f"<div class='device-label'>🌡️ Thermostat <span class='sensor-value'>{st.session_state.thermostat}°C</span></div>", unsafe_allow_html=True)
-            new_thermostat = st.slider("", 16, 30, st.session_state.thermostat, key="thermostat_slider", label_visibility="collapsed")
-            if new_thermostat != st.session_state.thermostat:
+            st.markdown(f"<div class='device-label'>🌡️ Thermostat <span class='sensor-value'>{devices['thermostat']}°C</span>{command_badge('thermostat')}</div>", unsafe_allow_html=True)
+            new_thermostat = st.slider("", 16, 30, devices['thermostat'], key="thermostat_slider", label_visibility="collapsed")
+            if new_thermostat != devices['thermostat']:
                 update_thermostat(new_thermostat)
 
             # Fan Control
-            st.markdown("<div class='device-label'>🌀 Fan Speed</div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='device-label'>🌀 Fan Speed{command_badge('fan')}</div>", unsafe_allow_html=True)
             fan_options = {0: "Off", 1: "Low", 2: "Medium", 3: "High"}
             fan_cols = st.columns(4)
             for i, (level, label) in enumerate(fan_options.items()):
@@ -309,26 +763,51 @@ def main_dashboard():
                         update_fan_speed(level)
 
             # Light Controls
-            st.markdown("<br>", unsafe_allow_html=True)
-            st.markdown("<div class='device-label'>💡 Lights</div>", unsafe_allow_html=True)
-            for room in st.session_state.lights:
-                status = "On" if st.session_state.lights[room] else "Off"
-                status_color = "green" if st.session_state.lights[room] else "gray"
-                st.markdown(f"<div class='device-label'>{room.capitalize()} <span style='color: {status_color};'>{status}</span></div>", unsafe_allow_html=True)
+            st.markdown("<div class='device-label' style='margin-top: 1rem;'>💡 Lights</div>", unsafe_allow_html=True)
+            for room, is_on in devices['lights'].items():
                 light_cols = st.columns([3, 1])
                 with light_cols[0]:
-                    st.markdown(f"<div style='height: 5px;'></div>", unsafe_allow_html=True)
+                    st.markdown(status_label(room.capitalize(), "On" if is_on else "Off", "green" if is_on else "gray",
+                                             command_badge(f'light:{room}')), unsafe_allow_html=True)
                 with light_cols[1]:
                     if st.button("Toggle", key=f"light_{room}", use_container_width=True):
                         toggle_light(room)
-            st.markdown("</div>", unsafe_allow_html=True)
+
+        # Sensor history charts, downsampled to the chart width.
+        # pandas is only needed here and on the Energy tab, so it is imported lazily.
+        import pandas as pd
+        st.subheader("📈 Sensor History")
+        history_cols = st.columns(2)
+        for i, (sensor, label) in enumerate([('temperature', 'Temperature (°C)'), ('humidity', 'Humidity (%)')]):
+            times, values = st.session_state.sensor_history.query(sensor, CHART_POINTS)
+            with history_cols[i]:
+                st.line_chart(pd.DataFrame({label: values}, index=pd.to_datetime(times, unit='s')))
+
+        # Activity log, newest first, one page at a time
+        st.subheader("📝 Recent Activity")
+        activity_filter = st.selectbox("Type", ["All"] + ACTIVITY_TYPES, key="activity_filter", on_change=newest_activity)
+        entries = get_activity_store().query(
+            limit=ACTIVITY_PAGE_SIZE,
+            entry_type=None if activity_filter == "All" else activity_filter,
+            before_id=st.session_state.activity_cursor
+        )
+        if entries:
+            st.markdown("\n".join(f"- `{entry['time']}` {entry['message']}" for entry in entries))
+        else:
+            st.markdown("No activity yet.")
+        page_cols = st.columns([3, 1, 1])
+        with page_cols[1]:
+            st.button("Newest", key="activity_newest", on_click=newest_activity,
+                      disabled=st.session_state.activity_cursor is None, use_container_width=True)
+        with page_cols[2]:
+            st.button("Older", key="activity_older", on_click=older_activity, args=(entries[-1]['id'] if entries else None,),
+                      disabled=len(entries) < ACTIVITY_PAGE_SIZE, use_container_width=True)
 
     # Security tab content
     elif st.session_state.current_tab == "Security":
         col1, col2 = st.columns(2)
 
         with col1:
-            st.markdown("<div class='card'>", unsafe_allow_html=True)
             st.subheader("🔐 Security System")
 
             # Security system status
@@ -336,9 +815,9 @@ def main_dashboard():
                 'disarmed': 'gray',
                 'armed_home': 'orange',
                 'armed_away': 'green'
-            }[st.session_state.security_system]
+            }[devices['security_system']]
 
-            st.markdown(f"<div class='device-label'>System Status <span class='sensor-value' style='color: {status_color};'>{st.session_state.security_system.replace('_', ' ').capitalize()}</span></div>", unsafe_allow_html=True)
+            st.markdown(f"<div class='device-label'>System Status <span class='sensor-value' style='color: {status_color};'>{devices['security_system'].replace('_', ' ').capitalize()}</span>{command_badge('security_system')}</div>", unsafe_allow_html=True)
 
             # Security system controls
             security_cols = st.columns(3)
@@ -353,11 +832,10 @@ def main_dashboard():
                     update_security_system("armed_away")
 
             # Door controls
-            st.markdown("<br>", unsafe_allow_html=True)
-            st.markdown("<div class='device-label'>🚪 Door Controls</div>", unsafe_allow_html=True)
-            for door, status in st.session_state.door_status.items():
-                door_color = "red" if status == "open" else "green"
-                st.markdown(f"<div class='device-label'>{door.capitalize()} <span style='color: {door_color};'>{status.capitalize()}</span></div>", unsafe_allow_html=True)
+            st.markdown("<div class='device-label' style='margin-top: 1rem;'>🚪 Door Controls</div>", unsafe_allow_html=True)
+            for door, status in devices['door_status'].items():
+                st.markdown(status_label(door.capitalize(), status.capitalize(), "red" if status == "open" else "green",
+                                         command_badge(f'door:{door}')), unsafe_allow_html=True)
                 door_cols = st.columns(2)
                 with door_cols[0]:
                     if st.button("Open", key=f"open_{door}", use_container_width=True):
@@ -365,86 +843,94 @@ def main_dashboard():
                 with door_cols[1]:
                     if st.button("Close", key=f"close_{door}", use_container_width=True):
                         update_door(door, "closed")
-            st.markdown("</div>", unsafe_allow_html=True)
 
         with col2:
-            st.markdown("<div class='card'>", unsafe_allow_html=True)
             st.subheader("📹 Security Cameras")
 
-            # Camera controls
-            for camera, status in st.session_state.cameras.items():
-                camera_status = "On" if status else "Off"
-                camera_color = "green" if status else "gray"
-                st.markdown(f"<div class='device-label'>{camera.replace('_', ' ').capitalize()} <span style='color: {camera_color};'>{camera_status}</span></div>", unsafe_allow_html=True)
+            # Camera status and live feed
+            for camera, status in devices['cameras'].items():
                 camera_cols = st.columns([3, 1])
                 with camera_cols[0]:
-                    st.markdown(f"<div style='height: 5px;'></div>", unsafe_allow_html=True)
+                    st.markdown(camera_card(camera, status, command_badge(f'camera:{camera}')), unsafe_allow_html=True)
+                    if status:
+                        live_camera_feed(camera)
                 with camera_cols[1]:
                     if st.button("Toggle", key=f"camera_{camera}", use_container_width=True):
                         toggle_camera(camera)
-                if status:
-                    # Placeholder for camera feed
-                    st.markdown(f"<div style='background-color: #d1d1d1; height: 120px; border-radius: 5px; display: flex; justify-content: center; align-items: center;'><p style='color: #555;'>Camera Feed: {camera.replace('_', ' ').capitalize()}</p></div>", unsafe_allow_html=True)
-                st.markdown("<div style='height: 10px;'></div>", unsafe_allow_html=True)
-            st.markdown("</div>", unsafe_allow_html=True)
 
     # Energy tab content
     elif st.session_state.current_tab == "Energy":
-        st.markdown("<div class='card'>", unsafe_allow_html=True)
         st.subheader("⚡ Energy Usage")
 
         # Display current energy metrics
+        energy_data = devices['energy_data']
         col1, col2, col3 = st.columns(3)
         with col1:
             st.metric(label="Today's Usage", 
-                      value=f"{st.session_state.energy_data['daily_usage']:.2f} kWh", 
-                      delta=f"{(random.random() - 0.6) * 2:.2f} kWh")
+                      value=f"{energy_data['daily_usage']:.2f} kWh", 
+                      delta=f"{energy_data['daily_delta']:.2f} kWh")
         with col2:
             st.metric(label="This Week", 
-                      value=f"{st.session_state.energy_data['weekly_total']:.2f} kWh", 
-                      delta=f"{(random.random() - 0.55) * 5:.2f} kWh")
+                      value=f"{energy_data['weekly_total']:.2f} kWh", 
+                      delta=f"{energy_data['weekly_delta']:.2f} kWh")
         with col3:
             st.metric(label="This Month", 
-                      value=f"{st.session_state.energy_data['monthly_total']:.2f} kWh", 
-                      delta=f"{(random.random() - 0.52) * 10:.2f} kWh")
-
-        # Create sample energy data for chart
-        energy_times = [f"{i}:00" for i in range(24)]
-        energy_values = [random.uniform(0.2, 1.5) for _ in range(24)]
-        energy_values[7] = 2.1  # Morning peak
-        energy_values[8] = 1.9
-        energy_values[18] = 2.3  # Evening peak
-        energy_values[19] = 2.5
-        energy_values[20] = 2.2
-
-        # Create a chart
-        st.line_chart(pd.DataFrame({'Energy (kWh)': energy_values}, index=energy_times))
-
-        # Energy saving recommendations
-        st.subheader("💡 Energy Saving Recommendations")
-        recommendations = [
-            "Turn off lights in unoccupied rooms",
-            "Reduce thermostat by 1°C to save up to 10% on heating costs",
-            "Use appliances during off-peak hours (10pm-7am)",
-            "Unplug devices not in use to eliminate standby power consumption"
+                      value=f"{energy_data['monthly_total']:.2f} kWh", 
+                      delta=f"{energy_data['monthly_delta']:.2f} kWh")
+
+        # Hourly usage per circuit over the last 24 hours
+        st.line_chart(get_energy_pipeline().chart_frame(24))
+
+        # Cheapest start times for shiftable loads and climate settings
+        st.subheader("💡 Load-Shifting Plan")
+        plan = energy_plan(devices)
+        st.metric(label="Estimated Daily Cost",
+                  value=f"${plan.cost:.2f}",
+                  delta=f"{-plan.savings:+.2f} $ with this plan",
+                  delta_color="inverse")
+        zones = devices['irrigation_zones']
+        rows = []
+        for load in plan.loads:
+            now = zones[load.name]['schedule'] if load.name in zones else format_schedule(load.current_start * 60)
+            rows.append({
+                "Load": load.name.replace('_', ' ').capitalize(),
+                "Runs": f"{load.minutes} min at {load.kw} kW",
+                "Now": now,
+                "Planned": now if load.start == load.current_start else format_schedule(load.start * 60),
+                "Saves": f"${load.current_cost - load.cost:.2f}"
+            })
+        st.dataframe(
+            rows,
+            hide_index=True,
+            use_container_width=True
+        )
+
+        # Hours whose thermostat or fan setting differs from the current one
+        changes = [
+            f"{hour:02d}:00 {setpoint:.0f}°C" + (f", fan {fan}" if fan != devices['fan_speed'] else "")
+            for hour, (setpoint, fan) in enumerate(zip(plan.setpoints, plan.fan_speeds))
+            if setpoint != devices['thermostat'] or fan != devices['fan_speed']
         ]
-        for i, rec in enumerate(recommendations):
-            st.markdown(f"**{i+1}.** {rec}")
-        st.markdown("</div>", unsafe_allow_html=True)
+        if changes:
+            st.caption("Climate schedule: " + " · ".join(changes))
+        st.button("Apply Irrigation Times", on_click=apply_irrigation_plan, args=(plan,),
+                  disabled=all(load.start == load.current_start for load in plan.loads
+                               if load.name in zones))
 
     # Irrigation tab content
     elif st.session_state.current_tab == "Irrigation":
-        st.markdown("<div class='card'>", unsafe_allow_html=True)
         st.subheader("🌱 Irrigation System")
 
-        for zone, data in st.session_state.irrigation_zones.items():
-            zone_status = "Active" if data['active'] else "Inactive"
-            zone_color = "green" if data['active'] else "gray"
-            st.markdown(f"<div class='device-label'><b>{zone.replace('_', ' ').capitalize()}</b> <span style='color: {zone_color};'>{zone_status}</span></div>", unsafe_allow_html=True)
+        for zone, data in devices['irrigation_zones'].items():
+            st.markdown(status_label(zone.replace('_', ' ').capitalize(), "Active" if data['active'] else "Inactive",
+                                     "green" if data['active'] else "gray", command_badge(f'irrigation:{zone}')),
+                        unsafe_allow_html=True)
             
             zone_cols = st.columns([2, 1, 1])
             with zone_cols[0]:
-                st.markdown(f"Schedule: {data['schedule']}, Duration: {data['duration']} min")
+                next_run = get_irrigation_scheduler().next_run(zone)
+                next_run_str = datetime.fromtimestamp(next_run).strftime("%a %I:%M %p") if next_run else "-"
+                st.markdown(f"Schedule: {data['schedule']}, Duration: {data['duration']} min, Next run: {next_run_str}")
             
             with zone_cols[1]:
                 new_schedule = st.time_input(f"New time", label_visibility="collapsed", key=f"time_{zone}")
@@ -457,9 +943,6 @@ def main_dashboard():
                                                key=f"duration_{zone}")
             
             control_cols = st.columns([3, 1, 1])
-            with control_cols[0]:
-                st.markdown(f"<div style='height: 5px;'></div>", unsafe_allow_html=True)
-            
             with control_cols[1]:
                 if st.button("Update Schedule", key=f"update_{zone}", use_container_width=True):
                     update_irrigation_schedule(zone, new_schedule_str, new_duration)
@@ -472,93 +955,103 @@ def main_dashboard():
 
         # Weather forecast (simplified)
         st.subheader("☁️ Weather Forecast")
-        weather_data = [
-            {"day": "Today", "icon": "☀️", "temp": "24°C", "precip": "0%"},
-            {"day": "Tomorrow", "icon": "⛅", "temp": "22°C", "precip": "10%"},
-            {"day": "Day 3", "icon": "🌧️", "temp": "19°C", "precip": "60%"},
-        ]
-
-        weather_cols = st.columns(len(weather_data))
-        for i, day in enumerate(weather_data):
-            with weather_cols[i]:
-                st.markdown(f"<div style='text-align: center;'><h4>{day['day']}</h4><p style='font-size: 2rem; margin: 0;'>{day['icon']}</p><p>{day['temp']}</p><p>Precipitation: {day['precip']}</p></div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
+        forecast = tuple((day['day'], day['icon'], day['temp'], day['precip']) for day in WEATHER_FORECAST)
+        st.markdown(forecast_card(forecast), unsafe_allow_html=True)
 
     # IoT Devices tab content
     elif st.session_state.current_tab == "IoT Devices":
-        st.markdown("<div class='card'>", unsafe_allow_html=True)
         st.subheader("🏠 Smart IoT Devices")
 
-        # Define IoT devices with their connection status and additional details
-        iot_devices = [
-            {
-                "name": "Smart Refrigerator",
-                "status": "Connected",
-                "details": "Temperature: 3°C, Door: Closed",
-                "icon": "❄️"
-            },
-            {
-                "name": "Smart Microwave",
-                "status": "Connected",
-                "details": "Last Used: 22:30, Mode: Standby",
-                "icon": "🍽️"
-            },
-            {
-                "name": "Smart Washing Machine",
-                "status": "Offline",
-                "details": "Last Cycle: Completed, Ready to Start",
-                "icon": "🧺"
-            },
-            {
-                "name": "Smart Dishwasher",
-                "status": "Connected",
-                "details": "Cycle: Drying, Remaining: 15 min",
-                "icon": "🍽️"
-            },
-            {
-                "name": "Smart Oven",
-                "status": "Connected",
-                "details": "Temperature: 180°C, Mode: Bake",
-                "icon": "🥘"
-            },
-            {
-                "name": "Smart Coffee Maker",
-                "status": "Offline",
-                "details": "Last Brew: Morning, Descaling Needed",
-                "icon": "☕"
-            }
-        ]
-
-        # Display IoT devices
-        for device in iot_devices:
-            # Determine status color
-            status_color = "green" if device["status"] == "Connected" else "red"
-            
-            # Create device card
-            st.markdown(f"""
-            <div class='wifi-network'>
-                <div>
-                    <b>{device['icon']} {device['name']}</b>
-                    <span style='color: {status_color}; margin-left: 10px;'>{device['status']}</span>
-                    <p style='color: gray; margin: 5px 0;'>{device['details']}</p>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
-        
-        st.markdown("</div>", unsafe_allow_html=True)
-
-        st.markdown("</div>", unsafe_allow_html=True)
+        # Search and filters; the inventory returns only the requested page
+        inventory = get_device_inventory()
+        search_col, status_col, type_col, room_col = st.columns([3, 2, 2, 2])
+        with search_col:
+            search = st.text_input("Search devices", key="iot_search", on_change=first_iot_page)
+        with status_col:
+            status = st.selectbox("Status", ["All"] + inventory.values("status"), key="iot_status", on_change=first_iot_page)
+        with type_col:
+            device_type = st.selectbox("Type", ["All"] + inventory.values("type"), key="iot_type", on_change=first_iot_page)
+        with room_col:
+            room = st.selectbox("Room", ["All"] + inventory.values("room"), key="iot_room", on_change=first_iot_page)
+
+        total, page = inventory.query(
+            status=None if status == "All" else status,
+            type=None if device_type == "All" else device_type,
+            room=None if room == "All" else room,
+            search=search,
+            offset=st.session_state.iot_page * IOT_PAGE_SIZE,
+            limit=IOT_PAGE_SIZE
+        )
+
+        # Display the page of IoT devices as one table
+        st.dataframe(
+            [
+                {
+                    "Device": f"{device['icon']} {device['name']}",
+                    "Status": ("🟢 " if device["status"] == "Connected" else "🔴 ") + device["status"],
+                    "Type": device["type"],
+                    "Room": device["room"],
+                    "Details": device["details"]
+                }
+                for device in page
+            ],
+            hide_index=True,
+            use_container_width=True
+        )
+
+        pages = max(1, -(-total // IOT_PAGE_SIZE))
+        prev_col, info_col, next_col = st.columns([1, 3, 1])
+        with prev_col:
+            st.button("Previous", on_click=change_iot_page, args=(-1,), disabled=st.session_state.iot_page == 0)
+        with info_col:
+            st.caption(f"{total} devices · page {st.session_state.iot_page + 1} of {pages}")
+        with next_col:
+            st.button("Next", on_click=change_iot_page, args=(1,), disabled=st.session_state.iot_page + 1 >= pages)
+
+    tab_timer.stop()
 
 # Main app logic
-def main():
+# Shown instead of the dashboard while a session is evicted
+def paused_page():
+    st.title("🏠 Smart Home Control Panel")
+    st.info(f"This session was paused after {SESSION_IDLE_SECONDS / 60:.0f} minutes without activity.")
+    st.button("Resume", on_click=resume_session)
+
+def render_page():
     # Check if user is logged in
-    if 'logged_in' not in st.session_state or not st.session_state.logged_in:
+    if not st.session_state.get('logged_in') and not resume_login():
         login_page()
         return
 
+    if 'resume_token' in st.session_state:
+        paused_page()
+        return
+
     # Render main dashboard
+    init_live_state()
     main_dashboard()
 
+def main():
+    get_metrics().inc("reruns")
+    start_house_duties()
+    st.session_state.last_interaction = time.time()
+    sample_session_bytes()
+
+    # ?profile=1 profiles this session's reruns only, once it is logged in
+    # and profiling is enabled for the deployment
+    if not (PROFILE_ENABLED and st.session_state.get('logged_in') and st.query_params.get("profile") == "1"):
+        render_page()
+        return
+    if 'profiler' not in st.session_state:
+        st.session_state.profiler = SamplingProfiler()
+    try:
+        with st.session_state.profiler.sampling():
+            render_page()
+    finally:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        ctx = get_script_run_ctx()
+        st.session_state.profiler.write(os.path.join(PROFILE_DIR, f"{ctx.session_id if ctx else 'local'}.folded"))
+
 # Run the main app
 if __name__ == "__main__":
     main()
@@ -0,0 +1,239 @@
+import base64
+import hashlib
+import hmac
+import json
+import os
+import threading
+import time
+
+from state_backend import MemoryBackend, update
+
+# scrypt cost: CPU/memory cost (a power of two), block size and parallelism.
+# Memory per hash is about 128 * n * r bytes (16 MiB by default). The cost is
+# stored with each hash, so raising it only affects newly hashed passwords;
+# `python benchmark.py --kdf` shows what each setting costs on this machine.
+SCRYPT_N = int(os.environ.get("AUTH_SCRYPT_N", 2 ** 14))
+SCRYPT_R = 8
+SCRYPT_P = 1
+SALT_BYTES = 16
+
+# Logins verified at once per process; further attempts wait for a slot
+VERIFY_WORKERS = 2
+
+# Random bytes in a session token's id
+TOKEN_ID_BYTES = 12
+
+# Token buckets: attempts allowed in a burst, and attempts regained per second
+USER_BURST, USER_RATE = 5, 1 / 12
+ADDRESS_BURST, ADDRESS_RATE = 20, 1 / 3
+
+# Buckets idle for this long are full again and are forgotten
+BUCKET_IDLE_SECONDS = 3600
+
+
+def _b64encode(data):
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def _b64decode(text):
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+# Salted scrypt hash of a password, as "scrypt$n$r$p$salt$hash"
+def hash_password(password, n=SCRYPT_N, r=SCRYPT_R, p=SCRYPT_P):
+    salt = os.urandom(SALT_BYTES)
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024)
+    return f"scrypt${n}${r}${p}${_b64encode(salt)}${_b64encode(digest)}"
+
+
+# Check a password against a hash from hash_password, comparing in constant time
+def verify_password(password, encoded):
+    try:
+        scheme, n, r, p, salt, expected = encoded.split("$")
+        n, r, p = int(n), int(r), int(p)
+        salt, expected = _b64decode(salt), _b64decode(expected)
+    except ValueError:
+        return False
+    if scheme != "scrypt":
+        return False
+    digest = hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p, maxmem=256 * n * r + 1024 * 1024,
+                            dklen=len(expected))
+    return hmac.compare_digest(digest, expected)
+
+
+# Password hashes by username, loaded once per process from a JSON object
+# ({"username": "scrypt$..."}) or, without a file, the built-in admin account.
+# Unknown usernames are checked against a dummy hash of the same cost, so a
+# failed login takes as long whether or not the user exists.
+class UserStore:
+    def __init__(self, path=None):
+        if path:
+            with open(path) as f:
+                self._hashes = json.load(f)
+        else:
+            self._hashes = {"admin": hash_password("password123")}
+        self._dummy = hash_password(_b64encode(os.urandom(SALT_BYTES)))
+
+    def __contains__(self, username):
+        return username in self._hashes
+
+    def verify(self, username, password):
+        encoded = self._hashes.get(username)
+        valid = verify_password(password, self._dummy if encoded is None else encoded)
+        return valid and encoded is not None
+
+
+# In-memory token buckets keyed by e.g. username or client address. Each
+# attempt takes a token before any password work is done; successful logins
+# give theirs back, so only failures drain a bucket.
+class RateLimiter:
+    def __init__(self, burst, rate):
+        self.burst = burst
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    # Take a token for `key`. Returns 0 on success, otherwise the seconds
+    # until the next token.
+    def take(self, key):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) / self.rate
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > 10000:
+                self._forget_idle(now)
+            return 0
+
+    def refund(self, key):
+        with self._lock:
+            if key in self._buckets:
+                tokens, updated = self._buckets[key]
+                self._buckets[key] = (min(self.burst, tokens + 1), updated)
+
+    def _forget_idle(self, now):
+        for key in [key for key, (_, updated) in self._buckets.items() if now - updated > BUCKET_IDLE_SECONDS]:
+            del self._buckets[key]
+
+
+# Signed, expiring session tokens ("username.id.expiry.signature"), checked
+# with one HMAC instead of a password hash. Each token has a random id, so
+# one login's token can be revoked without touching others of the same
+# user. A token is a bearer credential: anyone holding it (e.g. from a
+# copied URL) is logged in until it expires or is revoked. Replicas that
+# share AUTH_SECRET accept each other's tokens; without it, tokens last
+# until the process restarts.
+class SessionTokens:
+    def __init__(self, secret, ttl):
+        self._secret = secret
+        self.ttl = ttl
+
+    def _sign(self, payload):
+        return _b64encode(hmac.new(self._secret, payload.encode(), hashlib.sha256).digest())
+
+    def issue(self, username):
+        token_id = _b64encode(os.urandom(TOKEN_ID_BYTES))
+        payload = f"{_b64encode(username.encode())}.{token_id}.{int(time.time() + self.ttl)}"
+        return f"{payload}.{self._sign(payload)}"
+
+    # (username, token id, expiry) of a valid, unexpired token, otherwise None
+    def verify(self, token):
+        try:
+            user, token_id, expiry, signature = token.split(".")
+            expiry = int(expiry)
+        except (AttributeError, ValueError):
+            return None
+        # Compared as bytes: compare_digest rejects non-ASCII strings
+        expected = self._sign(f"{user}.{token_id}.{expiry}").encode()
+        if not hmac.compare_digest(signature.encode("ascii", "ignore"), expected) or expiry < time.time():
+            return None
+        try:
+            return _b64decode(user).decode(), token_id, expiry
+        except ValueError:
+            return None
+
+
+# Raised when a login attempt is refused before its password is checked
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many login attempts; try again in {retry_after:.0f} seconds")
+        self.retry_after = retry_after
+
+
+# Login checks for the whole process. Attempts are throttled per username
+# and per client address before any password work. The password is then
+# hashed on the caller's thread, which blocks for the length of one hash;
+# a semaphore keeps at most VERIFY_WORKERS hashes running at once however
+# many sessions try to log in, and further attempts wait their turn.
+# Revoked token ids are kept in the state backend until the tokens expire,
+# so a revocation reaches every replica sharing the backend.
+class Authenticator:
+    KEY = 'revoked_sessions'
+
+    def __init__(self, users, tokens, backend=None, workers=VERIFY_WORKERS):
+        self.users = users
+        self.tokens = tokens
+        self.backend = MemoryBackend() if backend is None else backend
+        self.user_limiter = RateLimiter(USER_BURST, USER_RATE)
+        self.address_limiter = RateLimiter(ADDRESS_BURST, ADDRESS_RATE)
+        self._slots = threading.BoundedSemaphore(workers)
+        self._revoked, self._version = self.backend.initialize({self.KEY: {}})[self.KEY]
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self.backend.subscribe(self._on_change)
+
+    def _on_change(self, key, value, version):
+        if key == self.KEY:
+            with self._state_lock:
+                if version > self._version:
+                    self._revoked, self._version = value, version
+
+    # A session token for valid credentials, otherwise None. Raises
+    # RateLimited without checking the password when either bucket is empty.
+    def login(self, username, password, address="unknown"):
+        user_key, address_key = f"user:{username}", f"address:{address}"
+        retry_after = self.address_limiter.take(address_key)
+        if retry_after:
+            raise RateLimited(retry_after)
+        retry_after = self.user_limiter.take(user_key)
+        if retry_after:
+            self.address_limiter.refund(address_key)
+            raise RateLimited(retry_after)
+
+        with self._slots:
+            valid = self.users.verify(username, password)
+        if not valid:
+            return None
+        self.user_limiter.refund(user_key)
+        self.address_limiter.refund(address_key)
+        return self.tokens.issue(username)
+
+    # Username of a valid, unrevoked session token, otherwise None; no
+    # password work
+    def resume(self, token):
+        verified = self.tokens.verify(token)
+        if verified is None:
+            return None
+        username, token_id, _ = verified
+        if username not in self.users or token_id in self._revoked:
+            return None
+        return username
+
+    # Invalidate one session token; other logins of the same user are
+    # unaffected. Revocations of expired tokens are dropped on the way.
+    def revoke(self, token):
+        verified = self.tokens.verify(token)
+        if verified is None:
+            return
+        _, token_id, expiry = verified
+
+        def change(revoked):
+            now = time.time()
+            kept = {other: until for other, until in revoked.items() if until >= now}
+            return dict(kept, **{token_id: expiry}), None
+        with self._lock:
+            value, version, _ = update(self.backend, self.KEY, change, self._revoked, self._version)
+            self._on_change(self.KEY, value, version)
@@ -0,0 +1,418 @@
+"""Headless rerun-latency benchmark and concurrent-session load test.
+
+Drives app.py through Streamlit's AppTest harness: logs in, switches tabs,
+presses controls and records script execution time, emitted elements and
+session memory. Results are printed (or written) as JSON.
+
+    python benchmark.py --iterations 20 --output bench.json
+    python benchmark.py --baseline bench.json          # fail on p95 regressions
+    python benchmark.py --load --sessions 200 --workers 16
+    python benchmark.py --startup                      # cold start and first paint
+    python benchmark.py --kdf                          # password hashing cost settings
+    python benchmark.py --traffic --seconds 30         # websocket messages of live refreshes
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP_PATH = os.path.join(APP_DIR, "app.py")
+sys.path.insert(0, APP_DIR)
+
+TABS = ["Dashboard", "Security", "Energy", "Irrigation", "IoT Devices"]
+
+# Controls pressed on each tab, by widget key
+TAB_CONTROLS = {
+    "Dashboard": ["light_kitchen", "fan_2", "fan_0"],
+    "Security": ["arm_home", "open_main", "close_main", "disarm_system", "camera_backyard"],
+    "Energy": [],
+    "Irrigation": ["toggle_garden"],
+    "IoT Devices": [],
+}
+
+
+# The scripted operator: for every tab, open it, rerun it and press its
+# controls. Yields (tab, Session method name, argument).
+def scenario_steps():
+    for tab in TABS:
+        yield tab, "open_tab", tab
+        yield tab, "rerun", None
+        for key in TAB_CONTROLS[tab]:
+            yield tab, "press", key
+
+
+def percentiles(samples):
+    import numpy as np
+
+    if not samples:
+        return {}
+    values = np.asarray(samples) * 1000
+    return {
+        "runs": len(samples),
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+        "p99_ms": round(float(np.percentile(values, 99)), 3),
+    }
+
+
+# Number of elements and bytes of element protos in the rendered page
+def element_stats(at):
+    count = size = 0
+    stack = [at._tree]
+    while stack:
+        node = stack.pop()
+        proto = getattr(node, "proto", None)
+        if proto is not None:
+            count += 1
+            size += proto.ByteSize()
+        children = getattr(node, "children", None)
+        if isinstance(children, dict):
+            stack.extend(children.values())
+    return count, size
+
+
+# One operator session driven through AppTest
+class Session:
+    def __init__(self, timeout=60):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+
+    def _timed(self, action):
+        start = time.perf_counter()
+        action()
+        elapsed = time.perf_counter() - start
+        if self.at.exception:
+            raise RuntimeError(self.at.exception[0].message)
+        return elapsed
+
+    def login(self, username="admin", password="password123"):
+        self._timed(self.at.run)
+        self.at.text_input[0].input(username)
+        self.at.text_input[1].input(password)
+        return self._timed(lambda: self.at.button[0].click().run())
+
+    def open_tab(self, tab):
+        return self._timed(lambda: self.at.button(key=f"tab_{tab}").click().run())
+
+    def press(self, key):
+        return self._timed(lambda: self.at.button(key=key).click().run())
+
+    def rerun(self, _=None):
+        return self._timed(self.at.run)
+
+    # Perform one scenario step and return its script run time
+    def step(self, method, arg):
+        return getattr(self, method)(arg)
+
+    def session_bytes(self):
+        from memory_usage import session_state_bytes
+        return sum(session_state_bytes(self.at.session_state.filtered_state).values())
+
+
+# Per-tab latency, element counts and session memory for a single session
+def run_benchmark(iterations):
+    session = Session()
+    login_seconds = session.login()
+
+    samples = {tab: [] for tab in TABS}
+    for _ in range(iterations):
+        for tab, method, arg in scenario_steps():
+            samples[tab].append(session.step(method, arg))
+
+    tabs = {}
+    for tab in TABS:
+        session.open_tab(tab)
+        elements, element_bytes = element_stats(session.at)
+        tabs[tab] = dict(percentiles(samples[tab]), elements=elements, element_bytes=element_bytes)
+
+    return {
+        "mode": "benchmark",
+        "iterations": iterations,
+        "login_ms": round(login_seconds * 1000, 3),
+        "session_bytes": session.session_bytes(),
+        "tabs": tabs,
+    }
+
+
+# One load-test worker process, standing in for one server process: it keeps
+# `sessions` sessions open and interleaves their steps so they share the
+# process's cached resources. Returns (latencies, errors).
+def _load_worker(sessions, rounds):
+    latencies, errors = [], []
+    operators = []
+    for _ in range(sessions):
+        try:
+            session = Session()
+            latencies.append(session.login())
+            operators.append(session)
+        except Exception as exc:
+            errors.append(str(exc))
+
+    steps = list(scenario_steps()) * rounds
+    for _, method, arg in steps:
+        for session in list(operators):
+            try:
+                latencies.append(session.step(method, arg))
+            except Exception as exc:
+                errors.append(str(exc))
+                operators.remove(session)
+    return latencies, errors
+
+
+# N simulated sessions spread over `workers` processes running in parallel.
+# AppTest swaps process-wide Streamlit state on every run, so sessions
+# cannot run in parallel threads of one process.
+def run_load_test(sessions, workers, rounds):
+    shares = [sessions // workers + (i < sessions % workers) for i in range(workers)]
+    start = time.perf_counter()
+    latencies, errors = [], []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for worker_latencies, worker_errors in pool.map(_load_worker, [n for n in shares if n], [rounds] * workers):
+            latencies.extend(worker_latencies)
+            errors.extend(worker_errors)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "mode": "load",
+        "sessions": sessions,
+        "workers": workers,
+        "rounds": rounds,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_runs_per_s": round(len(latencies) / elapsed, 3),
+        "latency": percentiles(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+# Cold-start probe, run in a fresh interpreter by run_startup_report(): times
+# the first paint of the login page and each later step, and records which
+# heavy modules had been imported by then.
+def _startup_probe():
+    start = time.perf_counter()
+
+    def checkpoint():
+        return {
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3),
+            "pandas_loaded": "pandas" in sys.modules,
+            "numpy_loaded": "numpy" in sys.modules,
+            "pyarrow_loaded": "pyarrow" in sys.modules,
+        }
+
+    session = Session()
+    report = {"harness_ready": checkpoint()}
+    session.rerun()
+    elements, element_bytes = element_stats(session.at)
+    report["login_page"] = dict(checkpoint(), elements=elements, element_bytes=element_bytes)
+    session.login()
+    report["dashboard"] = checkpoint()
+    for tab in TABS[1:]:
+        session.open_tab(tab)
+        report[tab] = checkpoint()
+    return report
+
+
+def run_startup_report():
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--startup-probe"],
+        check=True, capture_output=True, text=True, env=os.environ
+    ).stdout
+    return dict(mode="startup", steps=json.loads(output))
+
+
+# Time and memory of a password check at each scrypt cost, to choose
+# AUTH_SCRYPT_N: logins should stay well under a second even when
+# auth.VERIFY_WORKERS checks run at once
+def run_kdf_report(repeats=5):
+    from auth import SCRYPT_R, hash_password, verify_password
+
+    costs = []
+    for exponent in range(12, 18):
+        n = 2 ** exponent
+        encoded = hash_password("password123", n=n)
+        samples = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            verify_password("password123", encoded)
+            samples.append(time.perf_counter() - start)
+        costs.append(dict(n=n, memory_mib=128 * n * SCRYPT_R / 2 ** 20, **percentiles(samples)))
+    return dict(mode="kdf", costs=costs)
+
+
+# Serve the app with `streamlit run` and talk to it over its websocket the
+# way a browser does: load the dashboard with a minted session token, then
+# rerun each fragment on the interval the server asks for. Counts the
+# messages and bytes the server sends for those timed refreshes over
+# `seconds`, in total and per fragment, plus the deltas (element updates)
+# each refresh carries.
+def run_traffic_report(seconds, refresh):
+    import asyncio
+    import socket
+    from collections import defaultdict
+
+    from streamlit.proto.BackMsg_pb2 import BackMsg
+    from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+    from tornado.websocket import websocket_connect
+
+    from auth import SessionTokens
+
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    secret = os.urandom(16).hex()
+    env = dict(os.environ, AUTH_SECRET=secret, SENSOR_REFRESH_SECONDS=str(refresh))
+    server = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.headless", "true",
+         "--server.port", str(port), "--server.address", "127.0.0.1"],
+        env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    token = SessionTokens(secret.encode(), 3600).issue("admin")
+
+    async def measure():
+        for _ in range(100):
+            try:
+                ws = await websocket_connect(f"ws://127.0.0.1:{port}/_stcore/stream")
+                break
+            except OSError:
+                await asyncio.sleep(0.2)
+        else:
+            raise RuntimeError("streamlit server did not start")
+
+        def rerun(fragment_id=""):
+            msg = BackMsg()
+            msg.rerun_script.query_string = f"session={token}"
+            msg.rerun_script.fragment_id = fragment_id
+            ws.write_message(msg.SerializeToString(), binary=True)
+
+        async def timer(fragment_id, interval):
+            while True:
+                await asyncio.sleep(interval)
+                rerun(fragment_id)
+
+        first_paint = {"messages": 0, "bytes": 0, "deltas": 0}
+        window = defaultdict(lambda: {"runs": 0, "messages": 0, "bytes": 0, "deltas": 0})
+        timers = {}
+        current = first_paint
+        rerun()
+        deadline = None
+        while deadline is None or time.monotonic() < deadline:
+            timeout = 60 if deadline is None else max(deadline - time.monotonic(), 0.01)
+            try:
+                data = await asyncio.wait_for(ws.read_message(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if data is None:
+                raise RuntimeError("streamlit server closed the connection")
+            msg = ForwardMsg()
+            msg.ParseFromString(data)
+            kind = msg.WhichOneof("type")
+            if kind == "auto_rerun" and msg.auto_rerun.fragment_id not in timers:
+                timers[msg.auto_rerun.fragment_id] = asyncio.ensure_future(
+                    timer(msg.auto_rerun.fragment_id, msg.auto_rerun.interval))
+            # Fragments drawn by the full first run tag their deltas too
+            if kind == "delta" and msg.delta.fragment_id and deadline is not None:
+                current = window[msg.delta.fragment_id]
+            current["messages"] += 1
+            current["bytes"] += len(data)
+            current["deltas"] += kind == "delta"
+            if kind == "script_finished":
+                if deadline is None:
+                    deadline = time.monotonic() + seconds
+                else:
+                    current["runs"] += 1
+                current = window[""]
+        for task in timers.values():
+            task.cancel()
+        ws.close()
+        return first_paint, window
+
+    try:
+        first_paint, window = asyncio.run(measure())
+    finally:
+        server.terminate()
+        server.wait()
+
+    window.pop("", None)
+    fragments = [dict(stats, fragment=fragment_id,
+                      deltas_per_run=round(stats["deltas"] / max(stats["runs"], 1), 2),
+                      bytes_per_run=round(stats["bytes"] / max(stats["runs"], 1), 1))
+                 for fragment_id, stats in window.items()]
+    return {
+        "mode": "traffic",
+        "seconds": seconds,
+        "refresh_s": refresh,
+        "first_paint": first_paint,
+        "refresh_messages": sum(f["messages"] for f in fragments),
+        "refresh_bytes": sum(f["bytes"] for f in fragments),
+        "bytes_per_second": round(sum(f["bytes"] for f in fragments) / seconds, 1),
+        "fragments": fragments,
+    }
+
+
+# Tabs whose p95 grew by more than `tolerance` (a fraction) over the baseline
+def regressions(result, baseline, tolerance):
+    found = {}
+    for tab, stats in result.get("tabs", {}).items():
+        before = baseline.get("tabs", {}).get(tab)
+        if before and stats["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found[tab] = {"baseline_p95_ms": before["p95_ms"], "p95_ms": stats["p95_ms"]}
+    return found
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=10, help="scenario repetitions in benchmark mode")
+    parser.add_argument("--load", action="store_true", help="run the concurrent-session load test")
+    parser.add_argument("--sessions", type=int, default=20, help="simulated sessions in load mode")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes in load mode")
+    parser.add_argument("--rounds", type=int, default=1, help="scenario repetitions per session in load mode")
+    parser.add_argument("--startup", action="store_true", help="report cold-start and first-paint timings")
+    parser.add_argument("--kdf", action="store_true", help="time password hashing at each scrypt cost")
+    parser.add_argument("--traffic", action="store_true", help="measure websocket messages of the live refreshes")
+    parser.add_argument("--seconds", type=float, default=30, help="measurement window in traffic mode")
+    parser.add_argument("--refresh", type=float, default=1, help="sensor refresh interval in traffic mode")
+    parser.add_argument("--startup-probe", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--output", help="write the JSON result to this file")
+    parser.add_argument("--baseline", help="compare p95 per tab against this earlier benchmark result")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95 growth over the baseline")
+    args = parser.parse_args(argv)
+
+    # Keep benchmark activity and commands out of the real log and journal
+    scratch = tempfile.mkdtemp()
+    os.environ.setdefault("ACTIVITY_DB_PATH", os.path.join(scratch, "activity.db"))
+    os.environ.setdefault("JOURNAL_DIR", os.path.join(scratch, "journal"))
+
+    if args.startup_probe:
+        print(json.dumps(_startup_probe()))
+        return 0
+    if args.kdf:
+        result = run_kdf_report()
+    elif args.traffic:
+        result = run_traffic_report(args.seconds, args.refresh)
+    elif args.startup:
+        result = run_startup_report()
+    elif args.load:
+        result = run_load_test(args.sessions, args.workers, args.rounds)
+    else:
+        result = run_benchmark(args.iterations)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            result["regressions"] = regressions(result, json.load(f), args.tolerance)
+
+    output = json.dumps(result, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+    return 1 if result.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import io
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from datetime import datetime
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+logger = logging.getLogger(__name__)
+
+# Frame size of the synthetic cameras (height, width)
+FRAME_SHAPE = (180, 320)
+
+# Frames kept per camera; at CAPTURE_FPS a slot is rewritten only after a
+# couple of seconds, long after any encode of it has finished
+FRAME_RING_SIZE = 8
+
+# Frames captured per second by every enabled camera
+CAPTURE_FPS = 5
+
+# Frames encoded per second for one camera are FRAME_BUDGET / viewers, kept
+# between MIN_FPS and the hub's max_fps: a camera watched by a few sessions
+# updates as often as they refresh, one watched by many updates less often
+# so the frames pushed to all of them stay within budget
+FRAME_BUDGET = 8
+MIN_FPS = 0.2
+
+# A session stops counting as a viewer this many seconds after it last asked
+# for a frame (e.g. after leaving the Security tab)
+VIEWER_TIMEOUT = 5
+
+# Frames encoded at once per process
+ENCODE_WORKERS = 2
+JPEG_QUALITY = 70
+
+
+# Simulated camera: a fixed textured scene per camera with a figure walking
+# across it. read() draws straight into a ring buffer slot.
+class SyntheticSource:
+    def __init__(self, seed, shape=FRAME_SHAPE):
+        self.shape = shape + (3,)
+        height, width = shape
+        rng = np.random.default_rng(seed)
+        y = np.linspace(0, 1, height)[:, None, None]
+        x = np.linspace(0, 1, width)[None, :, None]
+        tint = rng.uniform(0.4, 1.0, 3)
+        scene = 60 + 120 * tint * (0.6 * y + 0.4 * x) + rng.normal(0, 6, self.shape)
+        self._scene = np.clip(scene, 0, 255).astype(np.uint8)
+        self._speed = rng.uniform(0.05, 0.15)
+
+    def read(self, out, timestamp):
+        height, width, _ = self.shape
+        out[:] = self._scene
+        phase = (timestamp * self._speed) % 1.0
+        left = int(phase * (width + 40)) - 40
+        top = height // 2 - 10 + int(6 * math.sin(timestamp * 3))
+        out[max(top, 0):top + 60, max(left, 0):max(left + 24, 0)] = (220, 200, 170)
+
+
+# Recorded camera: an (frames, height, width, 3) uint8 array saved with
+# numpy.save, memory-mapped and played in a loop at CAPTURE_FPS
+class FileSource:
+    def __init__(self, path):
+        self._frames = np.load(path, mmap_mode='r')
+        self.shape = self._frames.shape[1:]
+        self._index = 0
+
+    def read(self, out, timestamp):
+        out[:] = self._frames[self._index]
+        self._index = (self._index + 1) % len(self._frames)
+
+
+# `<camera>.npy` in `directory` if there is one, otherwise a synthetic camera
+def open_source(camera, directory=None):
+    path = os.path.join(directory, f"{camera}.npy") if directory else None
+    if path and os.path.exists(path):
+        return FileSource(path)
+    return SyntheticSource(sum(camera.encode()))
+
+
+# Fixed-size ring of frames for one camera, allocated once. The capture
+# thread writes the next slot in place and then publishes it; readers get
+# read-only views of the newest slot, so sharing a frame never copies it.
+class FrameRing:
+    def __init__(self, shape, capacity=FRAME_RING_SIZE):
+        self.frames = np.zeros((capacity,) + tuple(shape), dtype=np.uint8)
+        self.times = np.zeros(capacity)
+        self.seq = 0
+
+    # Slot the next frame is written into
+    def next_slot(self):
+        return self.frames[self.seq % len(self.frames)]
+
+    def publish(self, timestamp):
+        self.times[self.seq % len(self.frames)] = timestamp
+        self.seq += 1
+
+    # (seq, capture time, read-only view) of the newest frame, or None
+    def latest(self):
+        seq = self.seq
+        if seq == 0:
+            return None
+        slot = (seq - 1) % len(self.frames)
+        view = self.frames[slot]
+        view.flags.writeable = False
+        return seq, float(self.times[slot]), view
+
+
+# Frames of every camera for the whole process. One capture thread fills
+# each enabled camera's ring at CAPTURE_FPS. Sessions ask for frames with
+# frame(); each request marks the session as a viewer, and a camera's newest
+# frame is JPEG-encoded on a worker pool only when a viewer asks and the
+# last encode is older than the camera's viewer-dependent interval. Every
+# viewer gets the same bytes, so one encode serves any number of sessions,
+# and cameras nobody is watching are never encoded.
+class CameraHub:
+    def __init__(self, sources, enabled, capture_fps=CAPTURE_FPS, max_fps=1.0, frame_budget=FRAME_BUDGET,
+                 workers=ENCODE_WORKERS, quality=JPEG_QUALITY):
+        self.sources = sources
+        self.enabled = enabled
+        self.capture_fps = capture_fps
+        self.max_fps = max_fps
+        self.frame_budget = frame_budget
+        self.quality = quality
+        self.rings = {camera: FrameRing(source.shape) for camera, source in sources.items()}
+        self.encodes = {camera: 0 for camera in sources}
+        self._lock = threading.Lock()
+        self._viewers = {camera: {} for camera in sources}
+        self._encoded = {}
+        self._pending = {}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="camera-encode")
+        threading.Thread(target=self._capture_loop, name="camera-capture", daemon=True).start()
+
+    def _capture_loop(self):
+        interval = 1 / self.capture_fps
+        while True:
+            started = time.time()
+            for camera, source in self.sources.items():
+                try:
+                    if self.enabled(camera):
+                        ring = self.rings[camera]
+                        source.read(ring.next_slot(), started)
+                        ring.publish(started)
+                except Exception:
+                    logger.exception("Could not capture a frame from %s", camera)
+            time.sleep(max(interval - (time.time() - started), 0))
+
+    # Sessions that asked for this camera's frames within VIEWER_TIMEOUT
+    def viewers(self, camera):
+        cutoff = time.time() - VIEWER_TIMEOUT
+        with self._lock:
+            viewers = self._viewers[camera]
+            for viewer in [viewer for viewer, seen in viewers.items() if seen < cutoff]:
+                del viewers[viewer]
+            return len(viewers)
+
+    # Frames encoded per second for a camera with its current viewers
+    def fps(self, camera):
+        viewers = self.viewers(camera)
+        if not viewers:
+            return 0.0
+        return max(MIN_FPS, min(self.max_fps, self.frame_budget / viewers))
+
+    # Newest encoded JPEG of a camera for `viewer` (e.g. a session id), or
+    # None before its first frame. Starts an encode when one is due; only a
+    # camera's first frame is waited for, and for at most a few seconds.
+    def frame(self, camera, viewer):
+        with self._lock:
+            self._viewers[camera][viewer] = time.time()
+        encoded = self._encoded.get(camera)
+        latest = self.rings[camera].latest()
+        if latest is None:
+            return encoded[1] if encoded else None
+
+        due = encoded is None or (latest[0] != encoded[0] and time.time() - encoded[2] >= 1 / self.fps(camera))
+        if due:
+            with self._lock:
+                future = self._pending.get(camera)
+                if future is None:
+                    future = self._pending[camera] = self._executor.submit(self._encode, camera, *latest)
+            if encoded is None:
+                try:
+                    future.result(timeout=5)
+                except TimeoutError:
+                    return None
+                encoded = self._encoded.get(camera)
+        return encoded[1] if encoded else None
+
+    def _encode(self, camera, seq, captured_at, view):
+        try:
+            image = Image.fromarray(view)
+            label = f"{camera.replace('_', ' ').upper()}  {datetime.fromtimestamp(captured_at):%Y-%m-%d %H:%M:%S}"
+            ImageDraw.Draw(image).text((6, 4), label, fill=(255, 255, 255))
+            buffer = io.BytesIO()
+            image.save(buffer, format="JPEG", quality=self.quality)
+            self._encoded[camera] = (seq, buffer.getvalue(), time.time())
+            self.encodes[camera] += 1
+        except Exception:
+            logger.exception("Could not encode a frame from %s", camera)
+        finally:
+            with self._lock:
+                self._pending.pop(camera, None)
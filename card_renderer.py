@@ -0,0 +1,101 @@
+import html
+import string
+from functools import lru_cache
+
+
+# Already-rendered HTML that templates insert without escaping
+class Markup(str):
+    pass
+
+
+# HTML template parsed once, at import, into literal text and fields.
+# Rendering escapes every value that is not Markup and joins the pieces.
+class Template:
+    __slots__ = ('_parts',)
+
+    def __init__(self, source):
+        self._parts = tuple(
+            (literal, field, spec)
+            for literal, field, spec, _ in string.Formatter().parse(source)
+        )
+
+    def render(self, **values):
+        out = []
+        for literal, field, spec in self._parts:
+            out.append(literal)
+            if field is not None:
+                value = values[field]
+                out.append(value if isinstance(value, Markup) else html.escape(format(value, spec)))
+        return Markup("".join(out))
+
+
+CARD = Template("<div class='card'><h3>{title}</h3>{body}</div>")
+READING = Template(
+    "<div class='device-label'>{icon} {label} "
+    "<span class='sensor-value' style='color: {color};'>{value}</span></div>"
+)
+METER = Template("<div class='meter'><div style='width: {percent:.0f}%;'></div></div>")
+STATUS = Template("<div class='device-label'>{name} <span style='color: {color};'>{status}</span>{badge}</div>")
+FORECAST_DAY = Template(
+    "<div><h4>{day}</h4><p style='font-size: 2rem; margin: 0;'>{icon}</p>"
+    "<p>{temp}</p><p>Precipitation: {precip}%</p></div>"
+)
+FORECAST = Template("<div class='forecast'>{days}</div>")
+ALERT = Template("<div class='alert'><strong>⚠️ Alert:</strong> {message}</div>")
+
+
+def _clamp_percent(fraction):
+    return min(max(fraction, 0.0), 1.0) * 100
+
+
+# The card functions below are memoised on their arguments, so a card whose
+# content has not changed since it was last drawn is not rendered again.
+
+# Sensor Data card: readings, meters and door statuses. `doors` is a tuple
+# of (door, status) pairs.
+@lru_cache(maxsize=256)
+def sensor_card(temperature, humidity, motion, doors):
+    rows = [
+        READING.render(icon="🌡️", label="Temperature", value=f"{temperature}°C",
+                       color="red" if temperature > 25 else "black"),
+        METER.render(percent=_clamp_percent((temperature - 15) / 20)),
+        READING.render(icon="💧", label="Humidity", value=f"{humidity}%", color="inherit"),
+        METER.render(percent=_clamp_percent(humidity / 100)),
+        READING.render(icon="📡", label="Motion", value="Detected" if motion else "None",
+                       color="green" if motion else "gray"),
+    ]
+    rows.extend(
+        READING.render(icon="🚪", label=f"{door.capitalize()} Door", value=status.capitalize(),
+                       color="red" if status == "open" else "green")
+        for door, status in doors
+    )
+    return CARD.render(title="📊 Sensor Data", body=Markup("".join(rows)))
+
+
+# On/off or open/closed label of one device, with its command badge
+@lru_cache(maxsize=256)
+def status_label(name, status, color, badge=""):
+    return STATUS.render(name=name, status=status, color=color, badge=Markup(badge))
+
+
+# On/off label of one camera; its feed is an image below it
+@lru_cache(maxsize=64)
+def camera_card(camera, on, badge=""):
+    name = camera.replace('_', ' ').capitalize()
+    return STATUS.render(name=name, status="On" if on else "Off", color="green" if on else "gray", badge=Markup(badge))
+
+
+# Weather forecast row. `forecast` is a tuple of (day, icon, temp, precip).
+@lru_cache(maxsize=16)
+def forecast_card(forecast):
+    days = "".join(
+        FORECAST_DAY.render(day=day, icon=icon, temp=temp, precip=precip)
+        for day, icon, temp, precip in forecast
+    )
+    return FORECAST.render(days=Markup(days))
+
+
+# Active alert messages as one block
+@lru_cache(maxsize=64)
+def alert_list(messages):
+    return Markup("".join(ALERT.render(message=message) for message in messages))
@@ -0,0 +1,279 @@
+import atexit
+import copy
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+from device_registry import default_device_state
+
+logger = logging.getLogger(__name__)
+
+# Directory holding journal segments and snapshots, overridable for
+# deployments. Each journal owns its directory, so every replica needs its own.
+DEFAULT_DIR = os.environ.get("JOURNAL_DIR", "journal")
+
+# Entries between snapshots; each snapshot also starts a new journal segment
+SNAPSHOT_EVERY = 1000
+
+# Largest number of entries written (and fsynced) at once
+BATCH_SIZE = 256
+
+
+# Typed commands, one per device mutator. Each records the outcome of the
+# change (e.g. the light's new state rather than "toggle"), so replaying the
+# journal gives the same house whatever order concurrent sessions raced in.
+class SetLight(namedtuple('SetLight', 'room on')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['lights'][self.room] = self.on
+
+
+class SetThermostat(namedtuple('SetThermostat', 'value')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['thermostat'] = self.value
+
+
+class SetFanSpeed(namedtuple('SetFanSpeed', 'speed')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['fan_speed'] = self.speed
+
+
+class SetCamera(namedtuple('SetCamera', 'camera on')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['cameras'][self.camera] = self.on
+
+
+class SetSecuritySystem(namedtuple('SetSecuritySystem', 'status')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['security_system'] = self.status
+
+
+class SetDoor(namedtuple('SetDoor', 'door status')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['door_status'][self.door] = self.status
+
+
+class SetIrrigationActive(namedtuple('SetIrrigationActive', 'zone active')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['irrigation_zones'][self.zone]['active'] = self.active
+
+
+class ScheduleIrrigation(namedtuple('ScheduleIrrigation', 'zone schedule duration')):
+    __slots__ = ()
+
+    def apply(self, state):
+        state['irrigation_zones'][self.zone].update(schedule=self.schedule, duration=self.duration)
+
+
+# A whole device group as written by another replica, whose own commands
+# only reach this one as new group values
+class SetGroup(namedtuple('SetGroup', 'group value')):
+    __slots__ = ()
+
+    def apply(self, state):
+        if self.group not in state:
+            raise KeyError(self.group)
+        state[self.group] = copy.deepcopy(self.value)
+
+
+COMMANDS = {command.__name__: command for command in (
+    SetLight, SetThermostat, SetFanSpeed, SetCamera, SetSecuritySystem, SetDoor,
+    SetIrrigationActive, ScheduleIrrigation, SetGroup
+)}
+
+
+def _segment_path(directory, first_seq):
+    return os.path.join(directory, f"journal-{first_seq:012d}.jsonl")
+
+
+def _snapshot_path(directory, seq, timestamp):
+    return os.path.join(directory, f"snapshot-{seq:012d}-{int(timestamp * 1000):015d}.json")
+
+
+# Journal segments as (first seq, path), oldest first
+def list_segments(directory):
+    segments = []
+    for name in os.listdir(directory):
+        if name.startswith("journal-") and name.endswith(".jsonl"):
+            segments.append((int(name[8:-6]), os.path.join(directory, name)))
+    return sorted(segments)
+
+
+# Snapshots as (seq, timestamp, path), oldest first
+def list_snapshots(directory):
+    snapshots = []
+    for name in os.listdir(directory):
+        if name.startswith("snapshot-") and name.endswith(".json"):
+            seq, millis = name[9:-5].split("-")
+            snapshots.append((int(seq), int(millis) / 1000, os.path.join(directory, name)))
+    return sorted(snapshots)
+
+
+# Journal entries after `after_seq` as (seq, timestamp, command), in order.
+# Segments that end before `after_seq` are not opened, and a torn last line
+# left by a crash is ignored.
+def read_entries(directory, after_seq=0):
+    segments = list_segments(directory)
+    for i, (first_seq, path) in enumerate(segments):
+        if i + 1 < len(segments) and segments[i + 1][0] <= after_seq + 1:
+            continue
+        with open(path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning("Ignoring torn journal entry in %s", path)
+                    break
+                if entry["seq"] > after_seq:
+                    yield entry["seq"], entry["ts"], COMMANDS[entry["type"]](*entry["args"])
+
+
+# House state as of `timestamp` (default: the end of the journal), rebuilt
+# from the newest snapshot taken at or before it plus the entries after that
+# snapshot. Returns (state, seq, timestamp of the last applied entry).
+def state_at(directory, timestamp=None, initial_state=None):
+    state = copy.deepcopy(default_device_state() if initial_state is None else initial_state)
+    seq, last_ts = 0, 0.0
+    for snapshot_seq, snapshot_ts, path in reversed(list_snapshots(directory)):
+        if timestamp is None or snapshot_ts <= timestamp:
+            with open(path) as f:
+                state.update(json.load(f)["state"])
+            seq, last_ts = snapshot_seq, snapshot_ts
+            break
+
+    for entry_seq, entry_ts, command in read_entries(directory, seq):
+        if timestamp is not None and entry_ts > timestamp:
+            break
+        command.apply(state)
+        seq, last_ts = entry_seq, entry_ts
+    return state, seq, last_ts
+
+
+# Raised when another journal, in this or another process, already has the
+# directory open
+class JournalLocked(Exception):
+    def __init__(self, directory):
+        super().__init__(f"Journal directory {directory} is in use; give each replica its own JOURNAL_DIR")
+        self.directory = directory
+
+
+# Append-only journal of device commands. record() only enqueues; a writer
+# thread appends whatever has accumulated as JSON lines and fsyncs once per
+# batch, and keeps a materialised copy of the house state. Every
+# SNAPSHOT_EVERY entries it writes that state as a snapshot and starts a new
+# segment, so recovery reads one snapshot and a short tail. Sequence
+# numbers are local to the journal, so it holds an exclusive lock on its
+# directory for as long as it is open.
+class CommandJournal:
+    def __init__(self, directory=DEFAULT_DIR, snapshot_every=SNAPSHOT_EVERY, batch_size=BATCH_SIZE):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.batch_size = batch_size
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = open(os.path.join(directory, ".lock"), "a")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._lock_file.close()
+            raise JournalLocked(directory) from None
+
+        self._state, self.seq, self.last_ts = state_at(directory)
+        snapshots = list_snapshots(directory)
+        self._since_snapshot = self.seq - (snapshots[-1][0] if snapshots else 0)
+        self._segment = open(_segment_path(directory, self.seq + 1), "a")
+        self._state_lock = threading.Lock()
+        self._queue = queue.Queue()
+
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.flush)
+
+    # Copy of the house state after every entry written so far
+    def state(self):
+        with self._state_lock:
+            return copy.deepcopy(self._state)
+
+    # Queue one command for writing; O(1) for the caller
+    def record(self, command, timestamp=None):
+        self._queue.put((time.time() if timestamp is None else timestamp, command))
+
+    # Queue a whole device group as written by another replica
+    def record_group(self, group, value, timestamp=None):
+        self.record(SetGroup(group, value), timestamp)
+
+    # Block until every queued command is on disk
+    def flush(self):
+        self._queue.join()
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            except OSError:
+                logger.exception("Could not journal %d commands", len(batch))
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch):
+        lines = []
+        with self._state_lock:
+            for timestamp, command in batch:
+                try:
+                    command.apply(self._state)
+                except KeyError:
+                    logger.warning("Not journaling %r: unknown device", command)
+                    continue
+                self.seq += 1
+                # Entries are kept in time order even if the clock steps back
+                self.last_ts = max(timestamp, self.last_ts)
+                lines.append(json.dumps({
+                    "seq": self.seq, "ts": self.last_ts, "type": type(command).__name__, "args": list(command)
+                }) + "\n")
+        self._segment.write("".join(lines))
+        self._segment.flush()
+        os.fsync(self._segment.fileno())
+
+        self._since_snapshot += len(lines)
+        if self._since_snapshot >= self.snapshot_every:
+            self._snapshot()
+
+    # Write the state atomically as a snapshot and start a new segment
+    def _snapshot(self):
+        with self._state_lock:
+            data = json.dumps({"seq": self.seq, "ts": self.last_ts, "state": self._state})
+            path = _snapshot_path(self.directory, self.seq, self.last_ts)
+        temporary = f"{path}.tmp"
+        with open(temporary, "w") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, path)
+
+        self._segment.close()
+        self._segment = open(_segment_path(self.directory, self.seq + 1), "a")
+        self._since_snapshot = 0
@@ -0,0 +1,199 @@
+import asyncio
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+# Command states, in the order a command normally goes through them
+PENDING = 'pending'
+SENDING = 'sending'
+ACKNOWLEDGED = 'acknowledged'
+# Replaced by a newer command for the same device and action before it was sent
+SUPERSEDED = 'superseded'
+TIMEOUT = 'timeout'
+FAILED = 'failed'
+
+FINAL_STATES = {ACKNOWLEDGED, SUPERSEDED, TIMEOUT, FAILED}
+
+
+# One command for one device, e.g. ("light:kitchen", "set", True).
+# The bus updates status from its event loop; the UI only reads it.
+class Command:
+    __slots__ = ('id', 'device', 'action', 'value', 'status', 'error',
+                 'submitted_at', 'completed_at', '_done')
+
+    def __init__(self, command_id, device, action, value=None):
+        self.id = command_id
+        self.device = device
+        self.action = action
+        self.value = value
+        self.status = PENDING
+        self.error = None
+        self.submitted_at = time.time()
+        self.completed_at = None
+        self._done = threading.Event()
+
+    def _finish(self, status, error=None):
+        self.status = status
+        self.error = error
+        self.completed_at = time.time()
+        self._done.set()
+
+    # Block the calling thread until the command completes; True if it did
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+
+# Transports open connections to the device hub. A connection needs an async
+# send(command) that returns once the hub acknowledges, and an async close().
+class Transport:
+    async def connect(self):
+        raise NotImplementedError
+
+
+# In-process stand-in for a device hub. Records every delivered command and
+# optionally passes it to a handler.
+class LoopbackBroker:
+    def __init__(self, handler=None):
+        self.handler = handler
+        self.delivered = deque(maxlen=1000)
+        self.connections_opened = 0
+
+    def deliver(self, command):
+        self.delivered.append((command.device, command.action, command.value))
+        if self.handler is not None:
+            self.handler(command)
+
+
+class LoopbackConnection:
+    def __init__(self, broker, latency):
+        self.broker = broker
+        self.latency = latency
+
+    async def send(self, command):
+        await asyncio.sleep(self.latency)
+        self.broker.deliver(command)
+
+    async def close(self):
+        pass
+
+
+# Transport talking to a LoopbackBroker with a simulated round-trip latency
+class LoopbackTransport(Transport):
+    def __init__(self, broker=None, latency=0.05):
+        self.broker = LoopbackBroker() if broker is None else broker
+        self.latency = latency
+
+    async def connect(self):
+        self.broker.connections_opened += 1
+        return LoopbackConnection(self.broker, self.latency)
+
+
+# Up to `size` persistent connections shared by all device workers.
+# Connections are opened lazily and reused; one that fails is discarded.
+class ConnectionPool:
+    def __init__(self, transport, size=4):
+        self.transport = transport
+        self.size = size
+        self._idle = asyncio.LifoQueue()
+        self._opened = 0
+
+    @asynccontextmanager
+    async def connection(self):
+        if self._idle.empty() and self._opened < self.size:
+            self._opened += 1
+            try:
+                conn = await self.transport.connect()
+            except BaseException:
+                self._opened -= 1
+                raise
+        else:
+            conn = await self._idle.get()
+        try:
+            yield conn
+        except BaseException:
+            self._opened -= 1
+            await conn.close()
+            raise
+        else:
+            self._idle.put_nowait(conn)
+
+
+# Sends device commands from a background asyncio event loop so Streamlit's
+# script thread never blocks on hardware. Commands for one device are sent
+# in order by a single worker; commands for different devices run
+# concurrently over the connection pool. A queued command is replaced by a
+# newer one for the same device and action, so e.g. dragging the thermostat
+# slider only sends the last value.
+class CommandBus:
+    def __init__(self, transport, pool_size=4, timeout=2.0, history=500):
+        self.timeout = timeout
+        self.history = history
+        self._ids = itertools.count(1)
+        self._queues = {}
+        self._workers = {}
+        self._latest = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="device-command-bus", daemon=True)
+        self._thread.start()
+        self.pool = asyncio.run_coroutine_threadsafe(self._make_pool(transport, pool_size), self.loop).result()
+
+    async def _make_pool(self, transport, pool_size):
+        return ConnectionPool(transport, pool_size)
+
+    # Queue a command from any thread and return it immediately
+    def submit(self, device, action, value=None):
+        command = Command(next(self._ids), device, action, value)
+        with self._lock:
+            self._latest.pop(device, None)
+            self._latest[device] = command
+            while len(self._latest) > self.history:
+                self._latest.popitem(last=False)
+        self.loop.call_soon_threadsafe(self._enqueue, command)
+        return command
+
+    # Latest command submitted for a device, or None
+    def status(self, device):
+        with self._lock:
+            return self._latest.get(device)
+
+    # Commands that have not completed yet
+    def pending(self):
+        with self._lock:
+            return [command for command in self._latest.values() if command.status not in FINAL_STATES]
+
+    def _enqueue(self, command):
+        queue = self._queues.setdefault(command.device, deque())
+        for queued in queue:
+            if queued.action == command.action:
+                queue.remove(queued)
+                queued._finish(SUPERSEDED)
+                break
+        queue.append(command)
+        if command.device not in self._workers:
+            self._workers[command.device] = self.loop.create_task(self._drain(command.device))
+
+    async def _drain(self, device):
+        queue = self._queues[device]
+        while queue:
+            command = queue.popleft()
+            command.status = SENDING
+            try:
+                async with self.pool.connection() as conn:
+                    await asyncio.wait_for(conn.send(command), self.timeout)
+            except asyncio.TimeoutError:
+                command._finish(TIMEOUT, f"No acknowledgement within {self.timeout}s")
+            except Exception as exc:
+                command._finish(FAILED, str(exc))
+            else:
+                command._finish(ACKNOWLEDGED)
+        del self._workers[device]
+        del self._queues[device]
+
+    # Stop the event loop thread
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
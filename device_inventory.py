@@ -0,0 +1,162 @@
+import bisect
+import itertools
+import json
+import threading
+
+# Smallest query that uses the trigram index; shorter ones match name prefixes
+TRIGRAM = 3
+
+# Devices shown when no inventory file is configured
+DEFAULT_DEVICES = [
+    {"id": "fridge-1", "name": "Smart Refrigerator", "type": "Refrigerator", "room": "Kitchen",
+     "status": "Connected", "details": "Temperature: 3°C, Door: Closed", "icon": "❄️"},
+    {"id": "microwave-1", "name": "Smart Microwave", "type": "Microwave", "room": "Kitchen",
+     "status": "Connected", "details": "Last Used: 22:30, Mode: Standby", "icon": "🍽️"},
+    {"id": "washer-1", "name": "Smart Washing Machine", "type": "Washing Machine", "room": "Laundry",
+     "status": "Offline", "details": "Last Cycle: Completed, Ready to Start", "icon": "🧺"},
+    {"id": "dishwasher-1", "name": "Smart Dishwasher", "type": "Dishwasher", "room": "Kitchen",
+     "status": "Connected", "details": "Cycle: Drying, Remaining: 15 min", "icon": "🍽️"},
+    {"id": "oven-1", "name": "Smart Oven", "type": "Oven", "room": "Kitchen",
+     "status": "Connected", "details": "Temperature: 180°C, Mode: Bake", "icon": "🥘"},
+    {"id": "coffee-1", "name": "Smart Coffee Maker", "type": "Coffee Maker", "room": "Kitchen",
+     "status": "Offline", "details": "Last Brew: Morning, Descaling Needed", "icon": "☕"},
+]
+
+# Fields with an exact-match index
+INDEXED_FIELDS = ("status", "type", "room")
+
+
+def _trigrams(text):
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+
+# Device inventory with secondary indexes. Exact-match indexes map each
+# status, type and room to the ids having it; a trigram index answers
+# substring searches and a sorted token list answers short prefix searches.
+# Devices are added, updated and removed one at a time, touching only their
+# own index entries, and queries return one page at a time.
+class DeviceInventory:
+    def __init__(self, devices=()):
+        self._devices = {}
+        self._indexes = {field: {} for field in INDEXED_FIELDS}
+        self._trigrams = {}
+        self._tokens = []
+        self._order = []
+        self._lock = threading.Lock()
+        self.load(devices)
+
+    def __len__(self):
+        return len(self._devices)
+
+    def get(self, device_id):
+        return self._devices.get(device_id)
+
+    # Distinct values of an indexed field, for filter menus
+    def values(self, field):
+        with self._lock:
+            return sorted(value for value, ids in self._indexes[field].items() if ids)
+
+    def _index(self, device, insort=bisect.insort):
+        device_id = device["id"]
+        name = device["name"].lower()
+        for field in INDEXED_FIELDS:
+            self._indexes[field].setdefault(device[field], set()).add(device_id)
+        for trigram in _trigrams(name):
+            self._trigrams.setdefault(trigram, set()).add(device_id)
+        for token in set(name.split()):
+            insort(self._tokens, (token, device_id))
+        insort(self._order, (name, device_id))
+
+    def _unindex(self, device):
+        device_id = device["id"]
+        name = device["name"].lower()
+        for field in INDEXED_FIELDS:
+            self._indexes[field][device[field]].discard(device_id)
+        for trigram in _trigrams(name):
+            self._trigrams[trigram].discard(device_id)
+        for token in set(name.split()):
+            del self._tokens[bisect.bisect_left(self._tokens, (token, device_id))]
+        del self._order[bisect.bisect_left(self._order, (name, device_id))]
+
+    # Add many devices at once, sorting the ordered indexes once at the end
+    # rather than inserting into them one by one
+    def load(self, devices):
+        devices = {device["id"]: dict(device) for device in devices}
+        with self._lock:
+            for device_id in devices.keys() & self._devices.keys():
+                self._unindex(self._devices[device_id])
+            for device_id, device in devices.items():
+                self._devices[device_id] = device
+                self._index(device, insort=list.append)
+            self._tokens.sort()
+            self._order.sort()
+
+    # Add a device or replace the one with the same id
+    def upsert(self, device):
+        device = dict(device)
+        with self._lock:
+            old = self._devices.get(device["id"])
+            if old is not None:
+                self._unindex(old)
+            self._devices[device["id"]] = device
+            self._index(device)
+
+    # Change some fields of an existing device, e.g. its status
+    def update(self, device_id, **fields):
+        with self._lock:
+            device = self._devices[device_id]
+        self.upsert(dict(device, **fields))
+
+    def remove(self, device_id):
+        with self._lock:
+            device = self._devices.pop(device_id, None)
+            if device is not None:
+                self._unindex(device)
+
+    # Ids of devices whose name contains `text`
+    def _search(self, text):
+        text = text.lower().strip()
+        if len(text) >= TRIGRAM:
+            sets = sorted((self._trigrams.get(trigram, set()) for trigram in _trigrams(text)), key=len)
+            candidates = set.intersection(*sets) if sets else set()
+            return {device_id for device_id in candidates if text in self._devices[device_id]["name"].lower()}
+        start = bisect.bisect_left(self._tokens, (text,))
+        matches = set()
+        for token, device_id in self._tokens[start:]:
+            if not token.startswith(text):
+                break
+            matches.add(device_id)
+        return matches
+
+    # One page of devices ordered by name, filtered by exact field values and
+    # a name search. Returns (total matches, page of device dicts).
+    def query(self, status=None, type=None, room=None, search=None, offset=0, limit=25):
+        with self._lock:
+            filters = {"status": status, "type": type, "room": room}
+            sets = [self._indexes[field].get(value, set()) for field, value in filters.items() if value is not None]
+            if search:
+                sets.append(self._search(search))
+
+            if not sets:
+                page = self._order[offset:offset + limit]
+                return len(self._order), [self._devices[device_id] for _, device_id in page]
+
+            sets.sort(key=len)
+            matches = set.intersection(*sets)
+            if len(matches) * 4 >= len(self._order):
+                # Broad filter: walk the name order until the page is full
+                ordered = (device_id for _, device_id in self._order if device_id in matches)
+                page = itertools.islice(ordered, offset, offset + limit)
+            else:
+                ordered = sorted(matches, key=lambda device_id: (self._devices[device_id]["name"].lower(), device_id))
+                page = ordered[offset:offset + limit]
+            return len(matches), [self._devices[device_id] for device_id in page]
+
+
+# Load devices from a JSON list or JSON-lines file
+def load_devices(path):
+    with open(path) as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
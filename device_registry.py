@@ -0,0 +1,193 @@
+import threading
+from collections.abc import Mapping
+from types import MappingProxyType
+
+from state_backend import MemoryBackend, update
+
+# Groups derived from other state and republished every few seconds; they
+# are not journaled when another replica writes them
+UNJOURNALED_GROUPS = frozenset({'energy_data'})
+
+
+# Initial state of every device group in the house
+def default_device_state():
+    return {
+        'lights': {'living': False, 'kitchen': True, 'bedroom': False},
+        'thermostat': 22,
+        'fan_speed': 0,
+        'security_system': 'disarmed',
+        'cameras': {'front_door': True, 'backyard': False, 'garage': False},
+        'door_status': {'main': 'closed', 'garage': 'closed', 'back': 'closed'},
+        'energy_data': {
+            'daily_usage': 0.0,
+            'weekly_total': 0.0,
+            'monthly_total': 0.0,
+            'daily_delta': 0.0,
+            'weekly_delta': 0.0,
+            'monthly_delta': 0.0
+        },
+        'irrigation_zones': {
+            'front_lawn': {'active': False, 'schedule': '06:00 AM', 'duration': 15},
+            'backyard': {'active': False, 'schedule': '07:00 AM', 'duration': 20},
+            'garden': {'active': False, 'schedule': '05:30 AM', 'duration': 10}
+        }
+    }
+
+
+# Recursively wrap dicts in read-only proxies
+def freeze(value):
+    if isinstance(value, Mapping):
+        return MappingProxyType({key: freeze(item) for key, item in value.items()})
+    return value
+
+
+# Plain, mutable copy of a frozen value, for storing in a state backend
+def thaw(value):
+    if isinstance(value, Mapping):
+        return {key: thaw(item) for key, item in value.items()}
+    return value
+
+
+# Immutable, versioned view of every device group at one point in time.
+# Groups are shared with the registry (copy-on-write), so taking a snapshot
+# never copies device state.
+class DeviceSnapshot(Mapping):
+    __slots__ = ('version', '_groups')
+
+    def __init__(self, version, groups):
+        self.version = version
+        self._groups = groups
+
+    def __getitem__(self, group):
+        return self._groups[group]
+
+    def __iter__(self):
+        return iter(self._groups)
+
+    def __len__(self):
+        return len(self._groups)
+
+
+# Thread-safe store of device state shared by every session in the process,
+# kept in step with a StateBackend shared by every replica. Each device group
+# has its own lock, so e.g. a door update never waits on a light toggle.
+# Writers replace a group's frozen value instead of mutating it, which keeps
+# previously handed-out snapshots valid. Writes go to the backend first with
+# the group version they were based on and are retried against the newer
+# value if another replica wrote in between; changes made elsewhere arrive
+# through the backend's change notification. Reads never touch the backend.
+# Mutators take the command describing the change and record it in
+# `journal` while the group's lock is still held, so the journal sees each
+# group's changes in the order they were applied. Changes from other
+# replicas are journaled as whole groups under the same lock.
+class DeviceRegistry:
+    def __init__(self, initial_state=None, backend=None, journal=None):
+        if initial_state is None:
+            initial_state = default_device_state()
+        self.backend = MemoryBackend() if backend is None else backend
+        self.journal = journal
+        stored = self.backend.initialize(initial_state)
+        self._groups = {group: freeze(stored[group][0]) for group in initial_state}
+        self._group_versions = {group: stored[group][1] for group in initial_state}
+        self._locks = {group: threading.Lock() for group in self._groups}
+        self._writing = threading.local()
+        self._version_lock = threading.Lock()
+        self._version = 0
+        self._snapshot = DeviceSnapshot(0, MappingProxyType(dict(self._groups)))
+        self.backend.subscribe(self._on_change)
+
+    @property
+    def version(self):
+        return self._version
+
+    # Current state of the whole house. The same object is returned until the
+    # next write, so repeated reads between writes cost nothing.
+    def snapshot(self):
+        return self._snapshot
+
+    def get(self, group):
+        return self._groups[group]
+
+    # Store a new value for a group and publish a fresh snapshot, unless a
+    # newer version of the group has already been applied. Returns True if
+    # the value was stored.
+    def _commit(self, group, value, group_version):
+        with self._version_lock:
+            if group_version <= self._group_versions[group]:
+                return False
+            self._groups[group] = value
+            self._group_versions[group] = group_version
+            self._version += 1
+            self._snapshot = DeviceSnapshot(self._version, MappingProxyType(dict(self._groups)))
+            return True
+
+    def _on_change(self, group, value, group_version):
+        if group not in self._groups:
+            return
+        # Notified from inside our own write (MemoryBackend), which journals it
+        if getattr(self._writing, 'group', None) == group:
+            self._commit(group, freeze(value), group_version)
+            return
+        with self._locks[group]:
+            applied = self._commit(group, freeze(value), group_version)
+            if applied and self.journal is not None and group not in UNJOURNALED_GROUPS:
+                self.journal.record_group(group, value)
+
+    # Apply `change` (plain group value -> (new value, result)) through the
+    # backend, journal `command` (or, if it is callable, what it returns for
+    # the result) and return the result
+    def _write(self, group, change, command=None):
+        with self._locks[group]:
+            based_on = self._group_versions[group]
+            self._writing.group = group
+            try:
+                value, group_version, result = update(self.backend, group, change, thaw(self._groups[group]), based_on)
+            finally:
+                self._writing.group = None
+            self._commit(group, freeze(value), group_version)
+            if self.journal is not None:
+                if command is not None:
+                    self.journal.record(command(result) if callable(command) else command)
+                # Another replica wrote in between and its change has not
+                # been journaled here yet: journal the group as it now is
+                if group_version != based_on + 1 and group not in UNJOURNALED_GROUPS:
+                    self.journal.record_group(group, value)
+            return result
+
+    # Replace a scalar group (thermostat, fan speed, ...) and return the old value
+    def set(self, group, value, command=None):
+        return self._write(group, lambda old_value: (thaw(value), old_value), command)
+
+    # Set one device within a group (a light, a door, ...) and return the old value
+    def set_item(self, group, key, value, command=None):
+        def change(items):
+            items = dict(items)
+            old_value = items[key]
+            items[key] = thaw(value)
+            return items, old_value
+        return self._write(group, change, command)
+
+    # Flip a boolean device within a group, or one boolean field of a
+    # record-like device, and return its new value. `command` is called with
+    # the new value to build the command to journal.
+    def toggle(self, group, key, field=None, command=None):
+        def change(items):
+            items = dict(items)
+            if field is None:
+                value = items[key] = not items[key]
+            else:
+                record = dict(items[key])
+                value = record[field] = not record[field]
+                items[key] = record
+            return items, value
+        return self._write(group, change, command)
+
+    # Update some fields of a record-like device (e.g. an irrigation zone)
+    # and return the record as it was before the update
+    def update_item(self, group, key, command=None, **fields):
+        def change(items):
+            items = dict(items)
+            old_record = items[key]
+            items[key] = dict(old_record, **fields)
+            return items, old_record
+        return self._write(group, change, command)
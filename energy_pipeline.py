@@ -0,0 +1,260 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Circuits metered in the home and their share of the household load
+CIRCUITS = {'hvac': 0.45, 'kitchen': 0.25, 'lighting': 0.15, 'laundry': 0.15}
+
+# Typical household kWh per hour of the day, with morning and evening peaks
+HOURLY_PROFILE = np.array([
+    0.5, 0.4, 0.35, 0.3, 0.3, 0.4, 0.8, 2.1, 1.9, 1.1, 0.9, 0.9,
+    1.0, 0.9, 0.8, 0.8, 1.0, 1.4, 2.3, 2.5, 2.2, 1.6, 1.0, 0.7
+])
+
+# Seconds between background catch-ups of the meter
+CATCH_UP_SECONDS = 5
+
+# How many buckets each rollup keeps
+RETENTION = {'hourly': 24 * 14, 'daily': 70, 'weekly': 12, 'monthly': 24}
+
+
+# Seconds to add to a UTC timestamp to get local wall-clock time
+def _utc_offset(timestamp):
+    return datetime.fromtimestamp(timestamp).astimezone().utcoffset().total_seconds()
+
+
+# UTC offset of each of a batch of time-ordered timestamps. A batch of a few
+# days has one offset at both ends unless it crosses a change (DST), in
+# which case the offset is looked up per timestamp.
+def _utc_offsets(timestamps):
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if not len(timestamps):
+        return np.zeros(0)
+    first, last = _utc_offset(timestamps[0]), _utc_offset(timestamps[-1])
+    if first == last and timestamps[-1] - timestamps[0] < 7 * 86400:
+        return np.full(len(timestamps), first)
+    return np.array([_utc_offset(timestamp) for timestamp in timestamps.tolist()])
+
+
+# Timestamp at which the local wall-clock hour containing `timestamp` began.
+# Hours are local so they line up with half-hour offsets, and the hours
+# around a DST change are each their own bucket.
+def _hour_start(timestamp):
+    offset = _utc_offset(timestamp)
+    return int((timestamp + offset) // 3600 * 3600 - offset)
+
+
+# Starts of the local hours before `end` (an hour start), oldest first: the
+# last `count` of them, or all of those starting at or after `since`
+def _hours_before(end, count=None, since=float('-inf')):
+    starts = []
+    while count is None or len(starts) < count:
+        end = _hour_start(end - 1)
+        if end < since:
+            break
+        starts.append(end)
+    return starts[::-1]
+
+
+def _week_start(day):
+    return day - timedelta(days=day.weekday())
+
+
+# Bounded mapping of bucket -> kWh that drops its oldest buckets
+class Rollup:
+    def __init__(self, retention):
+        self.retention = retention
+        self.buckets = OrderedDict()
+
+    def add(self, bucket, kwh):
+        if bucket in self.buckets:
+            self.buckets[bucket] += kwh
+            return
+        # Late readings for buckets already past retention are ignored
+        if len(self.buckets) >= self.retention and bucket < next(iter(self.buckets)):
+            return
+        self.buckets[bucket] = kwh
+        while len(self.buckets) > self.retention:
+            self.buckets.popitem(last=False)
+
+    def get(self, bucket):
+        return self.buckets.get(bucket, 0.0)
+
+
+# Incremental energy rollups. Each reading is added to its hourly (per
+# circuit), daily, weekly and monthly bucket as it arrives, so totals are
+# always current without rescanning history.
+class EnergyPipeline:
+    def __init__(self, circuits=CIRCUITS):
+        self.circuits = list(circuits)
+        self.hourly = {circuit: Rollup(RETENTION['hourly']) for circuit in self.circuits}
+        self.hourly_total = Rollup(RETENTION['hourly'])
+        self.daily = Rollup(RETENTION['daily'])
+        self.weekly = Rollup(RETENTION['weekly'])
+        self.monthly = Rollup(RETENTION['monthly'])
+        # Incremented whenever an hourly bucket closes
+        self.closed_version = 0
+        self._open_hour = None
+        self._chart_cache = None
+        self._lock = threading.Lock()
+
+    # Add the kWh of one hour bucket to every rollup
+    def _add_hour(self, circuit, hour_start, kwh):
+        if self._open_hour is None or hour_start > self._open_hour:
+            if self._open_hour is not None:
+                self.closed_version += 1
+            self._open_hour = hour_start
+        day = datetime.fromtimestamp(hour_start).date()
+        self.hourly[circuit].add(hour_start, kwh)
+        self.hourly_total.add(hour_start, kwh)
+        self.daily.add(day, kwh)
+        self.weekly.add(_week_start(day), kwh)
+        self.monthly.add((day.year, day.month), kwh)
+
+    # Ingest one reading
+    def ingest(self, circuit, timestamp, kwh):
+        with self._lock:
+            self._add_hour(circuit, _hour_start(timestamp), kwh)
+
+    # Ingest a batch of time-ordered readings for one circuit. Readings are
+    # summed per hour with NumPy first, so the rollups are touched once per
+    # hour rather than once per reading.
+    def ingest_many(self, circuit, timestamps, kwh):
+        if not len(timestamps):
+            return
+        offsets = _utc_offsets(timestamps)
+        hours = ((np.asarray(timestamps) + offsets) // 3600 * 3600 - offsets).astype(np.int64)
+        starts = np.flatnonzero(np.r_[True, hours[1:] != hours[:-1]])
+        totals = np.add.reduceat(np.asarray(kwh, dtype=np.float64), starts)
+        with self._lock:
+            for hour_start, total in zip(hours[starts].tolist(), totals.tolist()):
+                self._add_hour(circuit, hour_start, total)
+
+    # Usage so far today, this week and this month, with each compared to
+    # the same point of the previous day, week and month
+    def summary(self, now=None):
+        now = datetime.now() if now is None else now
+        today = now.date()
+        yesterday = datetime.combine(today - timedelta(days=1), datetime.min.time())
+        week = _week_start(today)
+        last_month = (today.replace(day=1) - timedelta(days=1)).replace(day=1)
+
+        with self._lock:
+            daily_usage = self.daily.get(today)
+            weekly_total = self.weekly.get(week)
+            monthly_total = self.monthly.get((today.year, today.month))
+
+            # Yesterday up to the current hour, last week and last month up to
+            # the current day (or the end of last month, when it was shorter)
+            yesterday_so_far = sum(
+                self.hourly_total.get(start)
+                for start in _hours_before((yesterday + timedelta(hours=now.hour + 1)).timestamp(),
+                                           since=yesterday.timestamp())
+            )
+            last_week_so_far = sum(self.daily.get(week - timedelta(days=7 - d)) for d in range(today.weekday() + 1))
+            last_month_days = (today.replace(day=1) - last_month).days
+            last_month_so_far = sum(
+                self.daily.get(last_month + timedelta(days=d)) for d in range(min(today.day, last_month_days))
+            )
+
+        return {
+            'daily_usage': daily_usage,
+            'weekly_total': weekly_total,
+            'monthly_total': monthly_total,
+            'daily_delta': daily_usage - yesterday_so_far,
+            'weekly_delta': weekly_total - last_week_so_far,
+            'monthly_delta': monthly_total - last_month_so_far
+        }
+
+    # Total kWh of the last 24 closed hourly buckets by local hour of day,
+    # or None before a full day has been metered
+    def hourly_profile(self):
+        with self._lock:
+            if self._open_hour is None:
+                return None
+            starts = _hours_before(self._open_hour, 24)
+            if starts[0] not in self.hourly_total.buckets:
+                return None
+            profile = np.zeros(24)
+            for start in starts:
+                profile[datetime.fromtimestamp(start).hour] += self.hourly_total.get(start)
+            return profile
+
+    # Per-circuit kWh of the last `hours` closed hourly buckets. The frame is
+    # cached and rebuilt only when a new bucket has closed.
+    def chart_frame(self, hours=24):
+        import pandas as pd
+
+        with self._lock:
+            key = (self.closed_version, hours)
+            if self._chart_cache is not None and self._chart_cache[0] == key:
+                return self._chart_cache[1]
+            if self._open_hour is None:
+                starts = []
+            else:
+                starts = _hours_before(self._open_hour, hours)
+            frame = pd.DataFrame(
+                {circuit: [self.hourly[circuit].get(start) for start in starts] for circuit in self.circuits},
+                index=pd.to_datetime([datetime.fromtimestamp(start) for start in starts])
+            )
+            self._chart_cache = (key, frame)
+            return frame
+
+
+# Simulated per-minute meter for each circuit, following HOURLY_PROFILE with
+# some noise. poll() returns every reading since the previous poll.
+class SimulatedMeter:
+    def __init__(self, circuits=CIRCUITS, start=None, seed=None, step=60):
+        self.circuits = dict(circuits)
+        self.step = step
+        self.rng = np.random.default_rng(seed)
+        start = time.time() if start is None else start
+        self._last = int(start // step * step)
+        self._lock = threading.Lock()
+
+    # Readings since the last poll as {circuit: (timestamps, kwh)}
+    def poll(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            timestamps = np.arange(self._last + self.step, now + 1e-9, self.step)
+            if len(timestamps):
+                self._last = int(timestamps[-1])
+            hours = ((timestamps + _utc_offsets(timestamps)) // 3600 % 24).astype(np.int64)
+            base = HOURLY_PROFILE[hours] * self.step / 3600
+            return {
+                circuit: (timestamps, base * share * self.rng.uniform(0.6, 1.4, len(timestamps)))
+                for circuit, share in self.circuits.items()
+            }
+
+
+# Feed every pending meter reading into the pipeline. Returns True when new
+# readings were ingested.
+def catch_up(pipeline, meter, now=None):
+    readings = meter.poll(now)
+    ingested = False
+    for circuit, (timestamps, kwh) in readings.items():
+        if len(timestamps):
+            pipeline.ingest_many(circuit, timestamps, kwh)
+            ingested = True
+    return ingested
+
+
+# Catch the pipeline up with the meter every `interval` seconds on a daemon
+# thread, calling `on_update` after each catch-up that ingested readings
+def catch_up_periodically(pipeline, meter, on_update, interval=CATCH_UP_SECONDS):
+    def loop():
+        while True:
+            try:
+                if catch_up(pipeline, meter):
+                    on_update()
+            except Exception:
+                logger.exception("Energy catch-up failed")
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="energy-catch-up", daemon=True).start()
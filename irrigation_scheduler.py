@@ -0,0 +1,216 @@
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Default number of zones a property can water at once (water pressure budget)
+DEFAULT_CONCURRENCY = 2
+
+# Seconds between background advances of the schedule
+TICK_SECONDS = 5
+
+# Scheduled runs are skipped when the forecast precipitation for that day is
+# at least this many percent
+RAIN_SKIP_THRESHOLD = 50
+
+# Event kinds; stops sort before starts at the same instant so a finishing
+# zone frees its slot for one starting at that moment
+STOP = 0
+START = 1
+
+
+# "06:00 AM" -> minutes after midnight
+def parse_schedule(schedule):
+    parsed = datetime.strptime(schedule.strip(), "%I:%M %p")
+    return parsed.hour * 60 + parsed.minute
+
+
+# Minutes after midnight -> "06:00 AM"
+def format_schedule(minute):
+    return datetime(2000, 1, 1, minute // 60, minute % 60).strftime("%I:%M %p")
+
+
+# First timestamp strictly after `after` at `minute` past local midnight
+def next_occurrence(minute, after):
+    moment = datetime.fromtimestamp(after)
+    candidate = datetime.combine(moment.date(), datetime.min.time()) + timedelta(minutes=minute)
+    if candidate.timestamp() <= after:
+        candidate += timedelta(days=1)
+    return candidate.timestamp()
+
+
+class ZoneSchedule:
+    __slots__ = ('zone', 'property', 'minute', 'duration', 'version')
+
+    def __init__(self, zone, property, minute, duration, version):
+        self.zone = zone
+        self.property = property
+        self.minute = minute
+        self.duration = duration
+        self.version = version
+
+
+# Runs irrigation zones on their daily schedules. Upcoming starts and stops
+# live in one binary heap, so finding and popping the next event is O(log n)
+# however many zones there are. Rescheduled or removed zones leave their old
+# heap entries behind; those are recognised by version and dropped when
+# popped. Each property has a concurrency budget: a zone that comes due while
+# the budget is used up waits in the property's queue and starts as soon as
+# another zone stops. Runs on days whose forecast precipitation reaches
+# RAIN_SKIP_THRESHOLD are skipped.
+class IrrigationScheduler:
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rain_skip_threshold=RAIN_SKIP_THRESHOLD):
+        self.concurrency = concurrency
+        self.rain_skip_threshold = rain_skip_threshold
+        self._zones = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._versions = itertools.count(1)
+        self._next_start = {}
+        self._running = {}
+        self._active = {}
+        self._waiting = {}
+        self._budgets = {}
+        self._forecast = {}
+        self._lock = threading.Lock()
+
+    def _push(self, when, kind, zone, token):
+        heapq.heappush(self._heap, (when, kind, next(self._seq), zone, token))
+
+    def _schedule_start(self, schedule, after):
+        when = next_occurrence(schedule.minute, after)
+        self._next_start[schedule.zone] = when
+        self._push(when, START, schedule.zone, schedule.version)
+
+    # Register or reschedule a zone; `schedule` is a time like "06:00 AM" and
+    # `duration` is in minutes
+    def set_zone(self, zone, schedule, duration, property='home', now=None):
+        now = datetime.now().timestamp() if now is None else now
+        with self._lock:
+            entry = ZoneSchedule(zone, property, parse_schedule(schedule), duration, next(self._versions))
+            self._zones[zone] = entry
+            self._schedule_start(entry, now)
+
+    # Register the zones of a {zone: {'schedule': ..., 'duration': ...}}
+    # mapping, rescheduling only those whose time or duration changed
+    def sync_zones(self, zones, now=None):
+        for zone, data in zones.items():
+            entry = self._zones.get(zone)
+            if entry is None or (entry.minute, entry.duration) != (parse_schedule(data['schedule']), data['duration']):
+                self.set_zone(zone, data['schedule'], data['duration'], now=now)
+
+    def remove_zone(self, zone):
+        with self._lock:
+            self._zones.pop(zone, None)
+            self._next_start.pop(zone, None)
+
+    # Maximum number of zones of a property that may run at once
+    def set_budget(self, property, concurrency):
+        with self._lock:
+            self._budgets[property] = concurrency
+
+    # Forecast precipitation (percent) for a date
+    def set_forecast(self, day, precipitation):
+        with self._lock:
+            self._forecast[day] = precipitation
+
+    def _current(self, zone, version):
+        entry = self._zones.get(zone)
+        return entry if entry is not None and entry.version == version else None
+
+    # Drop stale entries from the top of the heap
+    def _prune(self):
+        while self._heap:
+            when, kind, _, zone, token = self._heap[0]
+            if kind == START and self._current(zone, token) is None:
+                heapq.heappop(self._heap)
+            elif kind == STOP and self._running.get(zone, (None,))[0] != token:
+                heapq.heappop(self._heap)
+            else:
+                return
+
+    # Timestamp of the next start or stop, or None
+    def next_event_time(self):
+        with self._lock:
+            self._prune()
+            return self._heap[0][0] if self._heap else None
+
+    # Timestamp of a zone's next scheduled start, or None
+    def next_run(self, zone):
+        return self._next_start.get(zone)
+
+    def is_running(self, zone):
+        return zone in self._running
+
+    def _start(self, entry, now, actions):
+        run = next(self._seq)
+        self._running[entry.zone] = (run, entry.property)
+        self._active[entry.property] = self._active.get(entry.property, 0) + 1
+        self._push(now + entry.duration * 60, STOP, entry.zone, run)
+        actions.append((entry.zone, 'start', None))
+
+    def _start_or_wait(self, entry, now, actions):
+        if entry.zone in self._running:
+            return
+        budget = self._budgets.get(entry.property, self.concurrency)
+        if self._active.get(entry.property, 0) < budget:
+            self._start(entry, now, actions)
+        else:
+            self._waiting.setdefault(entry.property, deque()).append((entry.zone, entry.version))
+            actions.append((entry.zone, 'wait', "water pressure budget in use"))
+
+    def _stop(self, zone, now, actions):
+        _, property = self._running.pop(zone)
+        self._active[property] -= 1
+        actions.append((zone, 'stop', None))
+        waiting = self._waiting.get(property)
+        while waiting and self._active[property] < self._budgets.get(property, self.concurrency):
+            entry = self._current(*waiting.popleft())
+            if entry is not None and entry.zone not in self._running:
+                self._start(entry, now, actions)
+
+    # Process every event due at or before `now`. Returns the resulting
+    # actions as (zone, action, reason) with action one of 'start', 'stop',
+    # 'wait' or 'skip'. Runs whose whole window has already passed are skipped
+    # rather than started late.
+    def advance(self, now=None):
+        now = datetime.now().timestamp() if now is None else now
+        actions = []
+        with self._lock:
+            while True:
+                self._prune()
+                if not self._heap or self._heap[0][0] > now:
+                    return actions
+                when, kind, _, zone, token = heapq.heappop(self._heap)
+                if kind == STOP:
+                    self._stop(zone, now, actions)
+                    continue
+
+                entry = self._zones[zone]
+                self._schedule_start(entry, when)
+                precipitation = self._forecast.get(datetime.fromtimestamp(when).date(), 0)
+                if precipitation >= self.rain_skip_threshold:
+                    actions.append((zone, 'skip', f"{precipitation}% chance of rain"))
+                elif now - when >= entry.duration * 60:
+                    actions.append((zone, 'skip', "missed while the scheduler was not running"))
+                else:
+                    self._start_or_wait(entry, now, actions)
+
+    # Advance the schedule every `interval` seconds on a daemon thread and
+    # pass each batch of actions to `handle`, so runs fire whether or not
+    # anyone has the dashboard open
+    def run_in_background(self, handle, interval=TICK_SECONDS):
+        def loop():
+            while True:
+                try:
+                    handle(self.advance())
+                except Exception:
+                    logger.exception("Irrigation schedule tick failed")
+                time.sleep(interval)
+
+        threading.Thread(target=loop, name="irrigation-schedule", daemon=True).start()
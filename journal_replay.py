@@ -0,0 +1,56 @@
+"""Offline replay of the device command journal, for audits.
+
+Rebuilds the house state at any moment from the newest snapshot taken before
+it plus the journal entries after that snapshot, and prints it as JSON. With
+--log it also lists the last 100 commands up to that moment.
+
+    python journal_replay.py                                 # state now
+    python journal_replay.py --at "2026-10-18 14:30:00"      # state then
+    python journal_replay.py --at 1792333800 --log
+    python journal_replay.py --dir /var/lib/smarthome/journal
+"""
+import argparse
+import json
+import sys
+import time
+from datetime import datetime
+
+from command_journal import DEFAULT_DIR, read_entries, state_at
+
+
+# A Unix timestamp or an ISO date/time in local time
+def parse_time(value):
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="journal directory")
+    parser.add_argument("--at", type=parse_time, help="Unix time or ISO date/time to replay up to (default: now)")
+    parser.add_argument("--log", action="store_true", help="also list the last 100 commands up to that moment")
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    state, seq, last_ts = state_at(args.dir, args.at)
+    result = {
+        "seq": seq,
+        "last_entry": datetime.fromtimestamp(last_ts).isoformat() if seq else None,
+        "replay_ms": round((time.perf_counter() - start) * 1000, 3),
+        "state": state,
+    }
+    if args.log:
+        result["commands"] = [
+            {"seq": entry_seq, "time": datetime.fromtimestamp(entry_ts).isoformat(),
+             "command": type(command).__name__, **command._asdict()}
+            for entry_seq, entry_ts, command in read_entries(args.dir, max(seq - 100, 0))
+            if entry_seq <= seq
+        ]
+    print(json.dumps(result, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+import hashlib
+import threading
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+from energy_pipeline import CIRCUITS
+from irrigation_scheduler import parse_schedule
+
+HOURS = 24
+
+# Time-of-use tariff in $/kWh by hour of day: off-peak 22:00-07:00, peak
+# 17:00-21:00 and shoulder in between
+DEFAULT_TARIFF = np.array([0.12] * 7 + [0.22] * 10 + [0.38] * 4 + [0.22] + [0.12] * 2)
+
+# Power the home can draw before the supply is overloaded (kW); every kWh
+# above it is charged OVERLOAD_PENALTY on top of the tariff, which spreads
+# shifted loads out instead of stacking them into the cheapest hour
+SUPPLY_KW = 7.0
+OVERLOAD_PENALTY = 1.0
+
+# Irrigation pump power; watering may start between 20:00 and 06:59, when
+# less of it evaporates
+IRRIGATION_PUMP_KW = 0.75
+IRRIGATION_HOURS = tuple(hour >= 20 or hour < 7 for hour in range(HOURS))
+ANY_HOUR = (True,) * HOURS
+
+# Shiftable appliances by IoT device type: (kW, minutes per cycle, usual start hour)
+APPLIANCE_LOADS = {
+    "Washing Machine": (0.8, 90, 18),
+    "Dishwasher": (1.2, 120, 20),
+}
+
+# Heating/cooling share of the household load, and the share of it saved per
+# degree the thermostat is raised
+HVAC_SHARE = CIRCUITS['hvac']
+SAVING_PER_DEGREE = 0.10
+
+# The house is cooled: during peak hours the thermostat is raised by
+# SETBACK_DEGREES and the fan run at least at speed 1 to keep the room
+# comfortable, and the hour before a peak is pre-cooled by PRECOOL_DEGREES.
+# Hours priced at PEAK_FRACTION of the day's highest price or more (and
+# above the median) count as peak.
+SETBACK_DEGREES = 2
+PRECOOL_DEGREES = 1
+PEAK_FRACTION = 0.9
+SETPOINT_RANGE = (16, 30)
+
+# Fan power by speed (kW)
+FAN_KW = np.array([0.0, 0.03, 0.05, 0.08])
+
+# Plans kept by the optimizer's memo
+PLAN_CACHE_SIZE = 4096
+
+
+# A load that can run at any allowed start hour: power, run time, the start
+# hour it has now and a tuple of 24 booleans marking allowed start hours
+ShiftableLoad = namedtuple('ShiftableLoad', 'name kw minutes start allowed')
+
+# Everything a plan depends on for one home. `profile` is the home's
+# non-shiftable kWh by hour of day and `tariff` its $/kWh by hour of day.
+HomeInputs = namedtuple('HomeInputs', 'profile tariff loads thermostat fan_speed')
+
+# Planned start of one load, with its cost at the current and planned start
+LoadPlan = namedtuple('LoadPlan', 'name kw minutes current_start start current_cost cost')
+
+
+# A home's 24-hour schedule: load starts, thermostat setpoints and fan
+# speeds by hour, and the day's cost before and after
+class Plan(namedtuple('Plan', 'loads setpoints fan_speeds baseline_cost cost')):
+    __slots__ = ()
+
+    @property
+    def savings(self):
+        return self.baseline_cost - self.cost
+
+
+# Irrigation zones of the device registry as shiftable loads
+def irrigation_loads(zones):
+    return tuple(
+        ShiftableLoad(zone, IRRIGATION_PUMP_KW, data['duration'], parse_schedule(data['schedule']) // 60,
+                      IRRIGATION_HOURS)
+        for zone, data in zones.items()
+    )
+
+
+# One shiftable load per appliance type in APPLIANCE_LOADS among `device_types`
+def appliance_loads(device_types):
+    return tuple(
+        ShiftableLoad(device_type, kw, minutes, start, ANY_HOUR)
+        for device_type, (kw, minutes, start) in APPLIANCE_LOADS.items()
+        if device_type in device_types
+    )
+
+
+# Memo key of a home's inputs. The profile is rounded to watt-hours so
+# meter noise below that does not defeat the memo.
+def inputs_key(home):
+    digest = hashlib.sha1()
+    digest.update(np.round(np.asarray(home.profile, dtype=np.float64), 3).tobytes())
+    digest.update(np.asarray(home.tariff, dtype=np.float64).tobytes())
+    digest.update(repr((home.loads, home.thermostat, home.fan_speed)).encode())
+    return digest.digest()
+
+
+# kWh a load uses in each hour after its start, padded to `length` hours
+def _energy_by_hour(kw, minutes, length):
+    hours = np.arange(length)
+    return kw[..., None] * np.clip(minutes[..., None] / 60 - hours, 0, 1)
+
+
+# kWh by hour of day of `profile` without `loads` running at their current
+# starts. A metered profile already includes the scheduled loads, which
+# the optimizer adds back wherever it places them.
+def unscheduled_profile(profile, loads):
+    profile = np.array(profile, dtype=np.float64)
+    if loads:
+        kw = np.array([load.kw for load in loads], dtype=np.float64)
+        minutes = np.array([load.minutes for load in loads], dtype=np.float64)
+        length = min(max(int(np.ceil(minutes.max() / 60)), 1), HOURS)
+        window = (np.array([load.start % HOURS for load in loads])[:, None] + np.arange(length)) % HOURS
+        np.subtract.at(profile, window, _energy_by_hour(kw, minutes, length))
+    return np.maximum(profile, 0)
+
+
+# Cost of hourly loads: the tariff plus the overload penalty
+def _cost(tariff, load):
+    return (tariff * load).sum(-1) + OVERLOAD_PENALTY * np.maximum(load - SUPPLY_KW, 0).sum(-1)
+
+
+# Plan a batch of homes at once. Setpoints follow each home's peak hours.
+# Loads are then placed greedily, largest first: each round evaluates every
+# start hour of one load for every home in one vectorised step, against the
+# home's load so far, and keeps the cheapest allowed one (the current start
+# on ties).
+def optimize(homes):
+    count = len(homes)
+    rows = np.arange(count)
+    profile = np.array([home.profile for home in homes], dtype=np.float64)
+    tariff = np.array([home.tariff for home in homes], dtype=np.float64)
+    thermostat = np.array([home.thermostat for home in homes], dtype=np.float64)
+    fan_speed = np.array([home.fan_speed for home in homes], dtype=np.int64)
+
+    # Setback during peak hours and pre-cool the hour before
+    peak = (tariff >= PEAK_FRACTION * tariff.max(1, keepdims=True)) & (tariff > np.median(tariff, 1, keepdims=True))
+    precool = np.roll(peak, -1, axis=1) & ~peak
+    setpoints = np.clip(thermostat[:, None] + SETBACK_DEGREES * peak - PRECOOL_DEGREES * precool, *SETPOINT_RANGE)
+    fan_speeds = np.where(peak, np.maximum(fan_speed, 1)[:, None], fan_speed[:, None])
+    hvac_saving = profile * HVAC_SHARE * SAVING_PER_DEGREE * (setpoints - thermostat[:, None])
+    planned = profile - hvac_saving + FAN_KW[fan_speeds] - FAN_KW[fan_speed][:, None]
+
+    # Loads padded to the largest count per home, largest energy first
+    width = max((len(home.loads) for home in homes), default=0)
+    kw = np.zeros((count, width))
+    minutes = np.zeros((count, width))
+    current = np.zeros((count, width), dtype=np.int64)
+    allowed = np.zeros((count, width, HOURS), dtype=bool)
+    order = []
+    for i, home in enumerate(homes):
+        loads = sorted(home.loads, key=lambda load: -load.kw * load.minutes)
+        order.append(loads)
+        for j, load in enumerate(loads):
+            kw[i, j], minutes[i, j], current[i, j], allowed[i, j] = load.kw, load.minutes, load.start % HOURS, load.allowed
+    length = min(max(int(np.ceil(minutes.max(initial=0) / 60)), 1), HOURS)
+    energy = _energy_by_hour(kw, minutes, length)
+    window = (np.arange(HOURS)[:, None] + np.arange(length)) % HOURS
+
+    baseline = profile.copy()
+    for j in range(width):
+        np.add.at(baseline, (rows[:, None], window[current[:, j]]), energy[:, j])
+
+    starts = np.zeros((count, width), dtype=np.int64)
+    current_costs = np.zeros((count, width))
+    costs = np.zeros((count, width))
+    for j in range(width):
+        before = planned[:, window]
+        after = before + energy[:, j, None, :]
+        added = _cost(tariff[:, window], after) - _cost(tariff[:, window], before)
+        candidates = np.where(allowed[:, j] | (np.arange(HOURS) == current[:, j, None]), added, np.inf)
+        candidates[rows, current[:, j]] -= 1e-9
+        starts[:, j] = candidates.argmin(1)
+        current_costs[:, j] = added[rows, current[:, j]]
+        costs[:, j] = added[rows, starts[:, j]]
+        planned[rows[:, None], window[starts[:, j]]] += energy[:, j]
+
+    baseline_cost = _cost(tariff, baseline)
+    planned_cost = _cost(tariff, planned)
+    return [
+        Plan(
+            loads=tuple(
+                LoadPlan(load.name, load.kw, load.minutes, int(current[i, j]), int(starts[i, j]),
+                         float(current_costs[i, j]), float(costs[i, j]))
+                for j, load in enumerate(order[i])
+            ),
+            setpoints=tuple(setpoints[i].tolist()),
+            fan_speeds=tuple(fan_speeds[i].tolist()),
+            baseline_cost=float(baseline_cost[i]),
+            cost=float(planned_cost[i])
+        )
+        for i in range(count)
+    ]
+
+
+# Thread-safe memo of plans by input hash in front of optimize(). Batches
+# are planned in one vectorised call for just the homes whose inputs have
+# not been seen, so reruns with unchanged inputs cost a hash per home.
+class LoadOptimizer:
+    def __init__(self, cache_size=PLAN_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def plan(self, home):
+        return self.plan_batch([home])[0]
+
+    def plan_batch(self, homes):
+        keys = [inputs_key(home) for home in homes]
+        plans = {}
+        with self._lock:
+            for key in keys:
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    plans[key] = self._cache[key]
+
+        missing = {key: home for key, home in zip(keys, homes) if key not in plans}
+        if missing:
+            computed = dict(zip(missing, optimize(list(missing.values()))))
+            plans.update(computed)
+            with self._lock:
+                self._cache.update(computed)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [plans[key] for key in keys]
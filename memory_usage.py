@@ -0,0 +1,59 @@
+import sys
+
+import numpy as np
+
+
+# Approximate number of bytes held by an object and everything it references.
+# NumPy arrays count the buffers they own; shared objects are only counted once.
+def deep_sizeof(obj, seen=None):
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    # getsizeof already includes the buffer of arrays that own their data
+    if isinstance(obj, np.ndarray):
+        return sys.getsizeof(obj)
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, bytearray, int, float, bool, type(None))):
+        return size
+    if hasattr(obj, 'items'):
+        try:
+            items = list(obj.items())
+        except TypeError:
+            items = []
+        for key, value in items:
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(vars(obj), seen)
+    for slot in getattr(type(obj), '__slots__', ()):
+        if hasattr(obj, slot):
+            size += deep_sizeof(getattr(obj, slot), seen)
+    return size
+
+
+# Approximate bytes held by each key of a session state mapping
+def session_state_bytes(session_state):
+    seen = set()
+    return {key: deep_sizeof(session_state[key], seen) for key in list(session_state.keys())}
+
+
+# Session state kept while a session is evicted for being idle: the page the
+# operator was on, the last readings and the table filters, enough to put the
+# session back where it was. Everything else is rebuilt on resume.
+class ResumeToken:
+    KEYS = ('current_tab', 'temperature', 'humidity', 'iot_page', 'iot_search', 'iot_status', 'iot_type',
+            'iot_room', 'activity_filter')
+    __slots__ = ('values',)
+
+    def __init__(self, session_state):
+        self.values = tuple((key, session_state[key]) for key in self.KEYS if key in session_state)
+
+    def restore(self, session_state):
+        for key, value in self.values:
+            session_state[key] = value
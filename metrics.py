@@ -0,0 +1,228 @@
+import bisect
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the timing histogram buckets
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+# Seconds between samples of the sampling profiler
+PROFILE_INTERVAL = 0.005
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _format_value(value):
+    if math.isnan(value):
+        return "NaN"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+# Times one phase into the phase_seconds histogram; usable as a context
+# manager or stopped explicitly
+class Timer:
+    __slots__ = ('_metrics', '_phase', '_start')
+
+    def __init__(self, metrics, phase):
+        self._metrics = metrics
+        self._phase = phase
+        self._start = time.perf_counter()
+
+    def stop(self):
+        self._metrics.observe("phase_seconds", time.perf_counter() - self._start, phase=self._phase)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+# Process-wide counters, gauges and timing histograms, rendered in the
+# Prometheus text exposition format. Recording is a dict update under a lock
+# (a few microseconds), so instrumentation can stay on in production.
+# Gauges can be functions, which are only called when the metrics are read.
+class Metrics:
+    def __init__(self, prefix="smarthome"):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._descriptions = {}
+        self._counters = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def describe(self, name, kind, text):
+        self._descriptions[name] = (kind, text)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def set_gauge(self, name, value, **labels):
+        self._gauges[(name, tuple(sorted(labels.items())))] = value
+
+    # Gauge computed by calling `function` whenever metrics are rendered
+    def gauge_function(self, name, function, **labels):
+        self._gauges[(name, tuple(sorted(labels.items())))] = function
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        bucket = bisect.bisect_left(BUCKETS, value)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+            histogram[0][bucket] += 1
+            histogram[1] += value
+            histogram[2] += 1
+
+    def timer(self, phase):
+        return Timer(self, phase)
+
+    # Current value of a counter, mainly for tests and reports
+    def count(self, name, **labels):
+        return self._counters.get((name, tuple(sorted(labels.items()))), 0)
+
+    def _header(self, lines, name, default_kind, suffix=""):
+        kind, text = self._descriptions.get(name, (default_kind, ""))
+        full_name = f"{self.prefix}_{name}{suffix}"
+        if text:
+            lines.append(f"# HELP {full_name} {text}")
+        lines.append(f"# TYPE {full_name} {kind}")
+        return full_name
+
+    # Everything in the Prometheus text format
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {key: (list(buckets), total, count) for key, (buckets, total, count) in self._histograms.items()}
+        gauges = dict(self._gauges)
+
+        lines = []
+        for kind, series in (("counter", counters), ("gauge", gauges)):
+            for name in sorted({name for name, _ in series}):
+                full_name = self._header(lines, name, kind, "_total" if kind == "counter" else "")
+                for (series_name, labels), value in sorted(series.items(), key=lambda item: item[0]):
+                    if series_name != name:
+                        continue
+                    if callable(value):
+                        try:
+                            value = value()
+                        except Exception:
+                            logger.exception("Gauge %s failed", name)
+                            value = float("nan")
+                    lines.append(f"{full_name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name in sorted({name for name, _ in histograms}):
+            full_name = self._header(lines, name, "histogram")
+            for (series_name, labels), (buckets, total, count) in sorted(histograms.items(), key=lambda item: item[0]):
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(BUCKETS + (float("inf"),), buckets):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{full_name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{full_name}_sum{_format_labels(labels)} {total!r}")
+                lines.append(f"{full_name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+
+# Serve /metrics over HTTP from a daemon thread. Returns the server, or None
+# if the port is taken (e.g. by another server process on this host).
+def serve(metrics, port, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError:
+        logger.warning("Metrics port %s is in use; not serving metrics", port)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+# Rewrite `path` with the current metrics every `interval` seconds, e.g. for
+# node_exporter's textfile collector. Each write replaces the file atomically.
+def write_periodically(metrics, path, interval=15):
+    def loop():
+        while True:
+            try:
+                temporary = f"{path}.{os.getpid()}.tmp"
+                with open(temporary, "w") as f:
+                    f.write(metrics.render())
+                os.replace(temporary, path)
+            except OSError:
+                logger.exception("Could not write metrics to %s", path)
+            time.sleep(interval)
+
+    threading.Thread(target=loop, name="metrics-file", daemon=True).start()
+
+
+# Statistical profiler for one thread. While sampling() is active, a
+# background thread records the profiled thread's stack every `interval`
+# seconds; counts accumulate across uses and are written in the folded-stack
+# format that flame graph tools read.
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+
+    def _sample(self, thread_id, stop):
+        while not stop.wait(self.interval):
+            frame = sys._current_frames().get(thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    # Profile the calling thread for the duration of the block
+    @contextmanager
+    def sampling(self):
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(threading.get_ident(), stop), daemon=True)
+        sampler.start()
+        try:
+            yield self
+        finally:
+            stop.set()
+            sampler.join()
+
+    def write(self, path):
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
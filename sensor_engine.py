@@ -0,0 +1,127 @@
+import threading
+import time
+
+import numpy as np
+
+# Humidity is clamped to this range after every step
+HUMIDITY_MIN = 30
+HUMIDITY_MAX = 70
+
+# Chance of motion being detected on any tick
+MOTION_PROBABILITY = 0.1
+
+
+# Interface shared by every source of sensor data: the simulator below and
+# recorded-data replay (see sensor_replay.py).
+class SensorSource:
+    n_homes = 1
+
+    # Advance by one step. Returns a boolean mask of the homes where motion
+    # was newly detected on this step.
+    def tick(self):
+        raise NotImplementedError
+
+    # Current values of a single home as plain Python scalars
+    def reading(self, home=0):
+        raise NotImplementedError
+
+    # Current values of every home as arrays keyed by sensor
+    def arrays(self):
+        readings = [self.reading(home) for home in range(self.n_homes)]
+        return {sensor: np.array([reading[sensor] for reading in readings]) for sensor in ('temperature', 'humidity', 'motion')}
+
+    # Door events, as (door, status) pairs, that happened on the last step
+    def door_events(self):
+        return []
+
+    # tick() and the door events it produced, as one step
+    def step(self):
+        return self.tick(), self.door_events()
+
+
+# Batched sensor simulator: every home's state lives in one contiguous array
+# per sensor and a single tick advances the whole fleet at once.
+class SensorEngine(SensorSource):
+    def __init__(self, n_homes=1, seed=None, temperature=21.5, humidity=42):
+        self.n_homes = n_homes
+        self.rng = np.random.default_rng(seed)
+        self.temperature = np.full(n_homes, temperature, dtype=np.float64)
+        self.humidity = np.full(n_homes, humidity, dtype=np.int64)
+        self.motion = np.zeros(n_homes, dtype=bool)
+        # Scratch buffer reused by every tick so stepping does not allocate
+        self._draws = np.empty((3, n_homes), dtype=np.float64)
+
+    # Advance every home by one step. Returns a boolean mask of the homes
+    # where motion was newly detected on this tick.
+    def tick(self):
+        draws = self.rng.random(out=self._draws)
+
+        # Temperature: random walk of up to ±0.4°C, kept to one decimal
+        temperature = self.temperature + (draws[0] - 0.5) * 0.8
+        np.round(temperature, 1, out=self.temperature)
+
+        # Humidity: random walk of up to ±1%, rounded and clamped
+        humidity = np.round(self.humidity + (draws[1] - 0.5) * 2)
+        np.clip(humidity, HUMIDITY_MIN, HUMIDITY_MAX, out=humidity)
+        self.humidity[:] = humidity
+
+        # Motion: 10% chance per tick, report only rising edges
+        motion = draws[2] < MOTION_PROBABILITY
+        new_motion = motion & ~self.motion
+        self.motion[:] = motion
+        return new_motion
+
+    # Current values of a single home as plain Python scalars
+    def reading(self, home=0):
+        return {
+            'temperature': float(self.temperature[home]),
+            'humidity': int(self.humidity[home]),
+            'motion': bool(self.motion[home]),
+        }
+
+    # The sensor arrays themselves; callers must not modify them
+    def arrays(self):
+        return {'temperature': self.temperature, 'humidity': self.humidity, 'motion': self.motion}
+
+
+# One sensor source shared by every session of a process. step() advances
+# it at most once per `interval` seconds however many sessions call it, and
+# only the call that advanced it gets the step's motion mask and door
+# events, so their activity entries and alerts happen once. A step counts as
+# due a little early, so one session refreshing on the same interval is not
+# held back by timer jitter. Steps are numbered, so panels refreshed on
+# separate timers can tell whether they show the same step.
+class SharedSource(SensorSource):
+    def __init__(self, source, interval):
+        self.source = source
+        self.interval = interval
+        self.n_homes = source.n_homes
+        self.steps = 0
+        self._last_step = float('-inf')
+        self._stepped_at = time.time()
+        self._lock = threading.Lock()
+
+    # (new motion, door events) if this call advanced the source, else None
+    def step(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if now - self._last_step < self.interval * 0.9:
+                return None
+            self._last_step = now
+            result = self.source.step()
+            self.steps += 1
+            self._stepped_at = time.time()
+            return result
+
+    # (step number, reading of `home`, wall-clock time of the step), read
+    # together so the reading belongs to that step
+    def latest(self, home=0):
+        with self._lock:
+            return self.steps, self.source.reading(home), self._stepped_at
+
+    def reading(self, home=0):
+        with self._lock:
+            return self.source.reading(home)
+
+    def arrays(self):
+        return self.source.arrays()
@@ -0,0 +1,148 @@
+import time
+
+import numpy as np
+
+# Default number of rows kept (one day of 1 Hz data)
+DEFAULT_CAPACITY = 86400
+
+# Rows allocated up front; storage doubles as rows arrive, up to the capacity
+INITIAL_CAPACITY = 1024
+
+# Value columns of the sensor history. Readings carry at most one decimal,
+# whole percentages or flags, so float32 and bool lose nothing.
+SENSOR_COLUMNS = {'temperature': np.float32, 'humidity': np.float32, 'motion': np.bool_}
+
+
+# Bytes taken by one row: the timestamp plus every value column
+def row_bytes(columns=SENSOR_COLUMNS):
+    return np.dtype(np.float64).itemsize + sum(np.dtype(dtype).itemsize for dtype in columns.values())
+
+
+# Largest capacity whose fully grown buffer fits in `nbytes`
+def capacity_for(nbytes, columns=SENSOR_COLUMNS):
+    return max(INITIAL_CAPACITY, nbytes // row_bytes(columns))
+
+
+# Bounded ring buffer of rows that share one timestamp column, with one
+# compact array per value column. Storage starts small and doubles until it
+# reaches the capacity, so short sessions never pay for a full buffer; after
+# that the oldest rows are overwritten and memory stays fixed.
+class RingBuffer:
+    def __init__(self, columns, capacity=DEFAULT_CAPACITY, initial_capacity=INITIAL_CAPACITY):
+        self.capacity = capacity
+        allocated = min(initial_capacity, capacity)
+        self.times = np.zeros(allocated, dtype=np.float64)
+        self.columns = {name: np.zeros(allocated, dtype=dtype) for name, dtype in columns.items()}
+        self._head = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def nbytes(self):
+        return self.times.nbytes + sum(column.nbytes for column in self.columns.values())
+
+    # Double the storage; rows are still in order since the buffer has not
+    # wrapped yet
+    def _grow(self):
+        allocated = min(len(self.times) * 2, self.capacity)
+
+        def grown(array):
+            new = np.zeros(allocated, dtype=array.dtype)
+            new[:self._size] = array[:self._size]
+            return new
+
+        self.times = grown(self.times)
+        self.columns = {name: grown(column) for name, column in self.columns.items()}
+        self._head = self._size
+
+    # Add one row (column -> value), overwriting the oldest row once full
+    def append(self, row, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        if self._size == len(self.times) < self.capacity:
+            self._grow()
+        i = self._head
+        self.times[i] = timestamp
+        for name, column in self.columns.items():
+            column[i] = row.get(name, 0)
+        self._head = (i + 1) % len(self.times)
+        self._size = min(self._size + 1, self.capacity)
+
+    # The stored rows of a column as (older, newer) contiguous slices in time order
+    def _segments(self, column):
+        values = self.columns[column]
+        if self._size < self.capacity:
+            return [(self.times[:self._size], values[:self._size])]
+        return [
+            (self.times[self._head:], values[self._head:]),
+            (self.times[:self._head], values[:self._head]),
+        ]
+
+    # Samples with start <= timestamp <= end in time order. Each segment is
+    # sorted, so only the matching slices are copied, not the whole buffer.
+    def window(self, column, start=None, end=None):
+        times, values = [], []
+        for seg_times, seg_values in self._segments(column):
+            lo = 0 if start is None else np.searchsorted(seg_times, start, side='left')
+            hi = len(seg_times) if end is None else np.searchsorted(seg_times, end, side='right')
+            times.append(seg_times[lo:hi])
+            values.append(seg_values[lo:hi])
+        return np.concatenate(times), np.concatenate(values)
+
+    # Samples in the window reduced to at most max_points points
+    def downsampled(self, column, max_points, start=None, end=None):
+        times, values = self.window(column, start, end)
+        return downsample_minmax(times, values, max_points)
+
+    # Most recent sample as (timestamp, value), or None when empty
+    def latest(self, column):
+        if not self._size:
+            return None
+        i = (self._head - 1) % len(self.times)
+        return self.times[i], self.columns[column][i]
+
+
+# Min/max bucketing: split the series into max_points // 2 equal buckets and
+# keep the lowest and highest sample of each, in time order. Peaks and dips
+# survive, unlike plain decimation, and the whole pass is vectorized.
+def downsample_minmax(times, values, max_points):
+    n = len(values)
+    if n <= max_points or max_points < 2:
+        return times, values
+
+    buckets = max_points // 2
+    size = -(-n // buckets)
+    buckets = -(-n // size)
+
+    # Pad the last bucket with its final value so every row has equal length;
+    # argmin/argmax return the first occurrence, so a pad is never chosen.
+    padded = np.pad(values, (0, buckets * size - n), mode='edge').reshape(buckets, size)
+    offsets = np.arange(buckets) * size
+    lows = padded.argmin(axis=1) + offsets
+    highs = padded.argmax(axis=1) + offsets
+
+    keep = np.unique(np.concatenate([lows, highs]))
+    return times[keep], values[keep]
+
+
+# History of every simulated sensor: one reading per row
+class SensorHistory:
+    def __init__(self, capacity=DEFAULT_CAPACITY, columns=SENSOR_COLUMNS):
+        self.buffer = RingBuffer(columns, capacity)
+
+    def __len__(self):
+        return len(self.buffer)
+
+    @property
+    def nbytes(self):
+        return self.buffer.nbytes
+
+    # Record one reading dict (sensor -> value) taken at the same time
+    def record(self, reading, timestamp=None):
+        self.buffer.append(reading, timestamp)
+
+    # Downsampled (times, values) for one sensor, sized for a chart
+    def query(self, sensor, max_points, start=None, end=None):
+        return self.buffer.downsampled(sensor, max_points, start, end)
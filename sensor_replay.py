@@ -0,0 +1,312 @@
+import csv
+import json
+import mmap
+import os
+import threading
+import time
+
+import numpy as np
+
+from sensor_engine import SensorSource
+
+# Columns of a recording, in CSV header order. door and door_status are empty
+# on rows without a door event.
+CSV_COLUMNS = ['timestamp', 'temperature', 'humidity', 'motion', 'door', 'door_status']
+
+# Rows read from a recording at a time
+CHUNK_ROWS = 4096
+
+
+# A chunk of consecutive recorded rows. Sensor columns are arrays; door events
+# are (row, door, status) tuples since they are rare.
+class Chunk:
+    __slots__ = ('timestamp', 'temperature', 'humidity', 'motion', 'doors')
+
+    def __init__(self, timestamp, temperature, humidity, motion, doors):
+        self.timestamp = timestamp
+        self.temperature = temperature
+        self.humidity = humidity
+        self.motion = motion
+        self.doors = doors
+
+    def __len__(self):
+        return len(self.timestamp)
+
+
+def _parse_bool(value):
+    return value.strip().lower() in ('1', 'true', 'yes')
+
+
+# CSV recording read through a memory map. The cursor is a byte offset, so
+# only the rows being played are ever decoded, and seek() is a binary search
+# over byte offsets that touches O(log n) pages of the file.
+class CsvRecording:
+    def __init__(self, path, chunk_rows=CHUNK_ROWS):
+        self.path = path
+        self.chunk_rows = chunk_rows
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header_end = self._mm.find(b'\n') + 1
+        header = self._mm[:header_end].decode().strip().split(',')
+        self._index = {name: header.index(name) for name in CSV_COLUMNS if name in header}
+        self._data_start = header_end
+        self._cursor = header_end
+
+    def rewind(self):
+        self._cursor = self._data_start
+
+    # Start of the line containing byte `offset`
+    def _line_start(self, offset):
+        return self._mm.rfind(b'\n', self._data_start - 1, offset) + 1
+
+    def _timestamp_at(self, line_start):
+        line_end = self._mm.find(b'\n', line_start)
+        line = self._mm[line_start:line_end if line_end != -1 else len(self._mm)]
+        return float(line.split(b',', self._index['timestamp'] + 1)[self._index['timestamp']])
+
+    # Move the cursor to the first row at or after `timestamp`
+    def seek(self, timestamp):
+        lo, hi = self._data_start, len(self._mm)
+        while lo < hi:
+            mid = self._line_start((lo + hi) // 2)
+            next_line = self._mm.find(b'\n', mid)
+            next_line = len(self._mm) if next_line == -1 else next_line + 1
+            if not self._mm[mid:next_line].strip():
+                hi = mid
+            elif self._timestamp_at(mid) < timestamp:
+                lo = next_line
+            else:
+                hi = mid
+        self._cursor = lo
+
+    # Next chunk of rows, or None at the end of the recording
+    def read_chunk(self):
+        end = self._cursor
+        for _ in range(self.chunk_rows):
+            if end >= len(self._mm):
+                break
+            line_end = self._mm.find(b'\n', end)
+            end = len(self._mm) if line_end == -1 else line_end + 1
+        if end == self._cursor:
+            return None
+        lines = self._mm[self._cursor:end].decode().splitlines()
+        self._cursor = end
+
+        rows = [row for row in csv.reader(lines) if row]
+        if not rows:
+            return None
+        index = self._index
+        doors = []
+        if 'door' in index:
+            for i, row in enumerate(rows):
+                if row[index['door']]:
+                    doors.append((i, row[index['door']], row[index['door_status']]))
+        return Chunk(
+            np.array([float(row[index['timestamp']]) for row in rows]),
+            np.array([float(row[index['temperature']]) for row in rows]),
+            np.array([float(row[index['humidity']]) for row in rows]),
+            np.array([_parse_bool(row[index['motion']]) for row in rows]),
+            doors
+        )
+
+    def close(self):
+        self._mm.close()
+        self._file.close()
+
+
+# Binary columnar recording: a directory with one .npy file per column,
+# opened as memory maps. Door events are stored as an index into doors.json
+# (-1 for none) and a door_open flag.
+class ColumnarRecording:
+    def __init__(self, directory, chunk_rows=CHUNK_ROWS):
+        self.directory = directory
+        self.chunk_rows = chunk_rows
+        self._columns = {
+            name: np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+            for name in ('timestamp', 'temperature', 'humidity', 'motion', 'door', 'door_open')
+        }
+        with open(os.path.join(directory, 'doors.json')) as f:
+            self._doors = json.load(f)
+        self._cursor = 0
+
+    def __len__(self):
+        return len(self._columns['timestamp'])
+
+    def rewind(self):
+        self._cursor = 0
+
+    # Move the cursor to the first row at or after `timestamp`
+    def seek(self, timestamp):
+        self._cursor = int(np.searchsorted(self._columns['timestamp'], timestamp, side='left'))
+
+    # Next chunk of rows, or None at the end of the recording
+    def read_chunk(self):
+        start, end = self._cursor, min(self._cursor + self.chunk_rows, len(self))
+        if start >= end:
+            return None
+        self._cursor = end
+        columns = {name: np.asarray(column[start:end]) for name, column in self._columns.items()}
+        rows = np.flatnonzero(columns['door'] >= 0)
+        doors = [
+            (int(i), self._doors[columns['door'][i]], 'open' if columns['door_open'][i] else 'closed')
+            for i in rows
+        ]
+        return Chunk(
+            columns['timestamp'].astype(np.float64),
+            columns['temperature'].astype(np.float64),
+            columns['humidity'].astype(np.float64),
+            columns['motion'].astype(bool),
+            doors
+        )
+
+    def close(self):
+        pass
+
+
+# Open a recording: a directory is read as columnar, anything else as CSV
+def open_recording(path, chunk_rows=CHUNK_ROWS):
+    if os.path.isdir(path):
+        return ColumnarRecording(path, chunk_rows)
+    return CsvRecording(path, chunk_rows)
+
+
+# Convert a CSV recording to the columnar format in two streaming passes
+# (count rows, then fill preallocated memory-mapped columns), so files larger
+# than memory can be converted.
+def convert_to_columnar(csv_path, directory, chunk_rows=CHUNK_ROWS):
+    os.makedirs(directory, exist_ok=True)
+    recording = CsvRecording(csv_path, chunk_rows)
+    n_rows = 0
+    while True:
+        chunk = recording.read_chunk()
+        if chunk is None:
+            break
+        n_rows += len(chunk)
+
+    dtypes = {
+        'timestamp': np.float64, 'temperature': np.float32, 'humidity': np.float32,
+        'motion': np.bool_, 'door': np.int16, 'door_open': np.int8
+    }
+    columns = {
+        name: np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+', dtype=dtype, shape=(n_rows,))
+        for name, dtype in dtypes.items()
+    }
+    doors = {}
+    recording.rewind()
+    row = 0
+    while True:
+        chunk = recording.read_chunk()
+        if chunk is None:
+            break
+        end = row + len(chunk)
+        columns['timestamp'][row:end] = chunk.timestamp
+        columns['temperature'][row:end] = chunk.temperature
+        columns['humidity'][row:end] = chunk.humidity
+        columns['motion'][row:end] = chunk.motion
+        columns['door'][row:end] = -1
+        columns['door_open'][row:end] = -1
+        for i, door, status in chunk.doors:
+            columns['door'][row + i] = doors.setdefault(door, len(doors))
+            columns['door_open'][row + i] = status == 'open'
+        row = end
+    recording.close()
+
+    for column in columns.values():
+        column.flush()
+    with open(os.path.join(directory, 'doors.json'), 'w') as f:
+        json.dump(sorted(doors, key=doors.get), f)
+
+
+# Plays a recording back as a sensor source. With a speed (1.0 = real time,
+# 10.0 = ten times faster) each tick plays every row up to the current
+# playback time; with speed=None every tick plays exactly one row, as fast as
+# the caller ticks. At the end it loops back to the start if `loop` is set.
+# Several sessions can share one source through step(), which plays each
+# row, and hands out its door events, exactly once.
+class ReplaySource(SensorSource):
+    def __init__(self, recording, speed=1.0, loop=True):
+        self.recording = recording
+        self.speed = speed
+        self.loop = loop
+        self._chunk = None
+        self._row = 0
+        self._clock = None
+        self._state = {'temperature': 0.0, 'humidity': 0, 'motion': False}
+        self._door_events = []
+        self._lock = threading.Lock()
+        self.finished = False
+
+    # Playback starts at the next row played, as if the clock started now
+    def _reset_clock(self):
+        self._clock = None
+
+    # Next unplayed row, loading chunks as needed; None at the end
+    def _peek(self):
+        while self._chunk is None or self._row >= len(self._chunk):
+            self._chunk = self.recording.read_chunk()
+            self._row = 0
+            if self._chunk is None:
+                if not self.loop:
+                    return None
+                self.recording.rewind()
+                self._reset_clock()
+                self._chunk = self.recording.read_chunk()
+                if self._chunk is None:
+                    return None
+        return self._chunk, self._row
+
+    # Jump to the first recorded row at or after `timestamp`
+    def seek(self, timestamp):
+        with self._lock:
+            self.recording.seek(timestamp)
+            self._chunk = None
+            self._reset_clock()
+            self.finished = False
+
+    def tick(self):
+        self._door_events = []
+        new_motion = False
+        now = time.time()
+        while True:
+            position = self._peek()
+            if position is None:
+                self.finished = True
+                break
+            chunk, row = position
+            if not self.speed:
+                end = row + 1
+            else:
+                # Play every row up to the current playback time
+                if self._clock is None:
+                    self._clock = (now, chunk.timestamp[row])
+                target = self._clock[1] + (now - self._clock[0]) * self.speed
+                end = int(np.searchsorted(chunk.timestamp, target, side='right'))
+                if end <= row:
+                    break
+            new_motion |= self._play(chunk, row, end)
+            if not self.speed or end < len(chunk):
+                break
+        return np.array([new_motion])
+
+    # Apply rows [start, end) of a chunk. Returns True if motion started
+    # anywhere in those rows.
+    def _play(self, chunk, start, end):
+        motion = chunk.motion[start:end]
+        previous = np.concatenate(([self._state['motion']], motion[:-1]))
+        last = end - 1
+        self._state['temperature'] = round(float(chunk.temperature[last]), 1)
+        self._state['humidity'] = int(round(float(chunk.humidity[last])))
+        self._state['motion'] = bool(chunk.motion[last])
+        self._door_events.extend((door, status) for i, door, status in chunk.doors if start <= i < end)
+        self._row = end
+        return bool(np.any(motion & ~previous))
+
+    def reading(self, home=0):
+        return dict(self._state)
+
+    def door_events(self):
+        return list(self._door_events)
+
+    def step(self):
+        with self._lock:
+            return self.tick(), self.door_events()
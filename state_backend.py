@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for writes made by other processes
+POLL_INTERVAL = 0.25
+
+# Seconds a lease lasts without being renewed
+LEASE_SECONDS = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS state_seq ON state (seq);
+"""
+
+
+# Raised by write() when the key has moved past the expected version. Carries
+# the current value and version so the writer can retry without another read.
+class VersionConflict(Exception):
+    def __init__(self, key, value, version):
+        super().__init__(f"{key} is at version {version}")
+        self.key = key
+        self.value = value
+        self.version = version
+
+
+# Shared key-value state for every replica of the app. Values are JSON-like
+# (dicts, lists, strings, numbers, booleans) and each key has a version that
+# starts at 1 and grows by one per write. Writes are optimistic: they name the
+# version they were based on and fail with VersionConflict if another writer
+# got there first. Subscribers are called with (key, value, version) for
+# every change, including changes made by other processes.
+class StateBackend:
+    # Store `defaults` for keys that do not exist yet. Returns every key's
+    # current (value, version).
+    def initialize(self, defaults):
+        raise NotImplementedError
+
+    # Current (value, version) of a key; (None, 0) if it does not exist
+    def read(self, key):
+        raise NotImplementedError
+
+    # Replace a key's value if it is still at `expected_version` (0 for a new
+    # key) and return the new version
+    def write(self, key, value, expected_version):
+        raise NotImplementedError
+
+    def subscribe(self, callback):
+        raise NotImplementedError
+
+
+# Read-modify-write a key with optimistic concurrency. `change` gets the
+# current value and returns (new value, result); it is called again with the
+# winning value after every conflict. Returns (new value, version, result).
+def update(backend, key, change, value, version):
+    while True:
+        new_value, result = change(value)
+        try:
+            return new_value, backend.write(key, new_value, version), result
+        except VersionConflict as conflict:
+            value, version = conflict.value, conflict.version
+
+
+# Backend for a single server process; subscribers are notified synchronously
+class MemoryBackend(StateBackend):
+    def __init__(self):
+        self._values = {}
+        self._lock = threading.Lock()
+        self._subscribers = []
+
+    def initialize(self, defaults):
+        with self._lock:
+            for key, value in defaults.items():
+                self._values.setdefault(key, (value, 1))
+            return dict(self._values)
+
+    def read(self, key):
+        return self._values.get(key, (None, 0))
+
+    def write(self, key, value, expected_version):
+        with self._lock:
+            current, version = self._values.get(key, (None, 0))
+            if version != expected_version:
+                raise VersionConflict(key, current, version)
+            version += 1
+            self._values[key] = (value, version)
+        for callback in self._subscribers:
+            callback(key, value, version)
+        return version
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+
+
+def _connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return conn
+
+
+# Backend shared by every process that opens the same SQLite file. Each write
+# stamps its row with a database-wide sequence number, so a watcher thread can
+# fetch just the rows changed since it last looked; it only queries when
+# SQLite's data_version says another connection has committed.
+class SqliteBackend(StateBackend):
+    def __init__(self, path, poll_interval=POLL_INTERVAL):
+        self.path = path
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._subscribers = []
+        self._watcher = None
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = _connect(self.path)
+        return conn
+
+    def initialize(self, defaults):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM state").fetchone()[0]
+            for key, value in defaults.items():
+                seq += 1
+                conn.execute("INSERT OR IGNORE INTO state (key, value, version, seq) VALUES (?, ?, 1, ?)",
+                             (key, json.dumps(value), seq))
+            rows = conn.execute("SELECT key, value, version FROM state").fetchall()
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return {key: (json.loads(value), version) for key, value, version in rows}
+
+    def read(self, key):
+        row = self._conn().execute("SELECT value, version FROM state WHERE key = ?", (key,)).fetchone()
+        return (json.loads(row[0]), row[1]) if row else (None, 0)
+
+    def write(self, key, value, expected_version):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT value, version FROM state WHERE key = ?", (key,)).fetchone()
+            version = row[1] if row else 0
+            if version != expected_version:
+                raise VersionConflict(key, json.loads(row[0]) if row else None, version)
+            seq = conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM state").fetchone()[0]
+            conn.execute("INSERT OR REPLACE INTO state (key, value, version, seq) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value), version + 1, seq))
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return version + 1
+
+    def subscribe(self, callback):
+        self._subscribers.append(callback)
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="state-watcher", daemon=True)
+            self._watcher.start()
+
+    def _watch(self):
+        conn = _connect(self.path)
+        last_seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM state").fetchone()[0]
+        data_version = None
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                current = conn.execute("PRAGMA data_version").fetchone()[0]
+                if current == data_version:
+                    continue
+                data_version = current
+                rows = conn.execute(
+                    "SELECT key, value, version, seq FROM state WHERE seq > ? ORDER BY seq", (last_seq,)
+                ).fetchall()
+            except sqlite3.Error:
+                logger.exception("Could not read state changes")
+                continue
+            for key, value, version, seq in rows:
+                last_seq = seq
+                for callback in self._subscribers:
+                    try:
+                        callback(key, json.loads(value), version)
+                    except Exception:
+                        logger.exception("State change callback failed for %s", key)
+
+
+# Time-limited claim on a duty that only one replica should perform (e.g.
+# running the irrigation schedule), stored under "lease:<name>". held()
+# claims a free or lapsed lease and renews its own once half the term has
+# passed, each with one compare-and-swap write; if the holder stops, another
+# replica takes over within `ttl` seconds.
+class Lease:
+    def __init__(self, backend, name, ttl=LEASE_SECONDS, owner=None):
+        self.backend = backend
+        self.key = f"lease:{name}"
+        self.ttl = ttl
+        self.owner = owner or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._lock = threading.Lock()
+        self._value, self._version = backend.read(self.key)
+        backend.subscribe(self._on_change)
+
+    def _on_change(self, key, value, version):
+        if key == self.key:
+            with self._lock:
+                if version > self._version:
+                    self._value, self._version = value, version
+
+    def held(self, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            value, version = self._value, self._version
+        if value and value['expires'] > now and (value['owner'] != self.owner or value['expires'] - now > self.ttl / 2):
+            return value['owner'] == self.owner
+        claim = {'owner': self.owner, 'expires': now + self.ttl}
+        try:
+            version = self.backend.write(self.key, claim, version)
+        except VersionConflict as conflict:
+            self._on_change(self.key, conflict.value, conflict.version)
+            return False
+        self._on_change(self.key, claim, version)
+        return True
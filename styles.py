@@ -0,0 +1,59 @@
+import re
+from functools import lru_cache
+
+# Base styles for every page, increasing font size
+APP_CSS = """
+.block-container {
+    padding-top: 1rem;
+    padding-bottom: 1rem;
+    font-size: 16px;
+}
+.card {
+    font-size: 16px;
+}
+.device-label {
+    font-size: 16px;
+}
+.meter {
+    height: 8px;
+    margin: 4px 0 12px;
+    border-radius: 4px;
+    background: #e6e6e6;
+}
+.meter>div {
+    height: 100%;
+    border-radius: 4px;
+    background: #ff4b4b;
+}
+.forecast {
+    display: flex;
+    text-align: center;
+}
+.forecast>div {
+    flex: 1;
+}
+"""
+
+# Login page: larger font and full-width controls
+LOGIN_CSS = """
+.stApp {
+    font-size: 18px !important;
+}
+.stButton>button {
+    width: 100%;
+    font-size: 18px !important;
+}
+.stTextInput>div>div>input {
+    font-size: 18px !important;
+}
+"""
+
+
+# One minified <style> block for the given stylesheets. This module is
+# imported once per process (unlike app.py, which runs on every rerun), so
+# each combination is only built once.
+@lru_cache(maxsize=None)
+def style_tag(*stylesheets):
+    css = re.sub(r"\s+", " ", " ".join(stylesheets))
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
+    return f"<style>{css}</style>"